@@ -1,36 +1,269 @@
+import io
+import os
 import re
+import csv
+import mmap
+import sys
+import glob
+import json
+import time
+import queue
+import threading
+import cProfile
+import hashlib
+import tempfile
+import tracemalloc
 import logging
+import argparse
 import datetime
 from pathlib import Path
-from bs4 import BeautifulSoup
+from functools import lru_cache
+from contextlib import contextmanager, nullcontext
+from collections import Counter
+from dataclasses import dataclass
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bs4 import BeautifulSoup, SoupStrainer
 from icalendar import Calendar, Event
+from dateutil.rrule import rrulestr
 
 # 初始化日志
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 星期名称到星期数的映射
+WEEKDAY_NUMBERS = {
+    '星期一': 1,
+    '星期二': 2,
+    '星期三': 3,
+    '星期四': 4,
+    '星期五': 5,
+    '星期六': 6,
+    '星期日': 7
+}
+# 节次名称到节数的映射
+PERIOD_NUMBERS = {
+    '第一节': 1,
+    '第二节': 2,
+    '第三节': 3,
+    '第四节': 4,
+    '第五节': 5,
+    '第六节': 6,
+    '第七节': 7,
+    '第八节': 8,
+    '第九节': 9,
+    '第十节': 10,
+    '第十一节': 11
+}
+
+# 快速解析优先使用lxml 未安装时退回html.parser
+try:
+    import lxml  # noqa: F401
+    FAST_PARSER = 'lxml'
+except ImportError:
+    FAST_PARSER = 'html.parser'
+
+# 快速解析时只构建标题和表格标签
+COURSE_TABLE_STRAINER = SoupStrainer(['h3', 'table'])
+
+# 可选的解析引擎
+# full: 使用html.parser构建完整的文档树
+# fast: 只构建h3标题和课程表 优先使用lxml
+# mmap: 内存映射文件 只解码并解析h3标题和课程表所在的字节范围
+PARSER_ENGINES = ('full', 'fast', 'mmap')
+
+# 课程表的id
+COURSE_TABLE_ID = b'manualArrangeCourseTable'
+# 课程表的id属性 属性名不区分大小写 属性值与其余引擎一样区分大小写
+COURSE_TABLE_ID_PATTERN = re.compile(
+    rb'(?<=\s)(?i:id)\s*=\s*["\']?' + COURSE_TABLE_ID + rb'(?=["\'\s/>])')
+# 查找编码声明的范围
+CHARSET_SEARCH_SIZE = 4096
+CHARSET_PATTERN = re.compile(rb'charset\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+# GBK和GB2312都按其超集GB18030解码
+GB_ENCODINGS = ('gbk', 'gb2312', 'gb18030', 'cp936')
+# 课程表和标题的标签 不区分大小写
+TABLE_OPEN_PATTERN = re.compile(rb'<table(?=[\s>/])', re.IGNORECASE)
+TABLE_CLOSE_PATTERN = re.compile(rb'</table', re.IGNORECASE)
+H3_OPEN_PATTERN = re.compile(rb'<h3(?=[\s>/])', re.IGNORECASE)
+H3_CLOSE_PATTERN = re.compile(rb'</h3', re.IGNORECASE)
+
+
+# 检测课程表文件的编码
+def detect_encoding(buffer, sample=None) -> str:
+    """
+    按BOM和文件开头的charset声明检测编码 没有声明时检查内容是否为合法的UTF-8
+    Args:
+        buffer (bytes | mmap.mmap): 文件内容
+        sample (list): 实际要解码的字节片段 默认检查文件开头
+    Returns:
+        str: 编码名称
+    """
+    head = buffer[:CHARSET_SEARCH_SIZE]
+    if head.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    match = CHARSET_PATTERN.search(head)
+    if match is not None:
+        encoding = match.group(1).decode('ascii').lower()
+        return 'gb18030' if encoding in GB_ENCODINGS else encoding
+    if sample is not None:
+        # 片段都是完整的标签 必须全部是合法的UTF-8
+        try:
+            for piece in sample:
+                piece.decode('utf-8')
+        except UnicodeDecodeError:
+            return 'gb18030'
+        return 'utf-8'
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # 开头的4096字节可能截断在多字节字符中间
+        if e.start < len(head) - 3:
+            return 'gb18030'
+    return 'utf-8'
+
+
+# 查找标签的位置
+def _find_tag(buffer, pattern, start=0, end=None) -> int:
+    if end is None:
+        end = len(buffer)
+    match = pattern.search(buffer, start, end)
+    return -1 if match is None else match.start()
+
+
+# 提取课程表所在的片段
+def extract_course_html(buffer) -> str:
+    """
+    在原始字节中直接查找课程表和h3标题的字节范围 只解码这些片段
+    查找在bytes或mmap上进行 不复制整个文件
+    Args:
+        buffer (bytes | mmap.mmap): 文件内容
+    Returns:
+        str: 只包含h3标题和课程表的html 不存在课程表时返回None
+    """
+    # id可能先出现在脚本或其他标签中 只接受table开始标签中的id属性
+    table_start = -1
+    for match in COURSE_TABLE_ID_PATTERN.finditer(buffer):
+        tag_start = buffer.rfind(b'<', 0, match.start())
+        if (tag_start >= 0 and TABLE_OPEN_PATTERN.match(buffer, tag_start)
+                and buffer.find(b'>', tag_start, match.start()) < 0):
+            table_start = tag_start
+            break
+    if table_start < 0:
+        return None
+    # 跳过嵌套的表格 找到对应的结束标签
+    depth = 1
+    position = table_start + 1
+    while depth > 0:
+        close = _find_tag(buffer, TABLE_CLOSE_PATTERN, position)
+        if close < 0:
+            close = len(buffer)
+            break
+        nested = _find_tag(buffer, TABLE_OPEN_PATTERN, position, close)
+        if nested >= 0:
+            depth += 1
+            position = nested + 1
+        else:
+            depth -= 1
+            position = close + 1
+    table_end = buffer.find(b'>', close)
+    table_end = len(buffer) if table_end < 0 else table_end + 1
+    # 按文档顺序收集所有h3标题和课程表
+    pieces = [(table_start, table_end)]
+    position = 0
+    while True:
+        h3_start = _find_tag(buffer, H3_OPEN_PATTERN, position)
+        if h3_start < 0:
+            break
+        h3_end = _find_tag(buffer, H3_CLOSE_PATTERN, h3_start)
+        if h3_end < 0:
+            break
+        h3_end = buffer.find(b'>', h3_end) + 1 or len(buffer)
+        if not table_start <= h3_start < table_end:
+            pieces.append((h3_start, h3_end))
+        position = h3_end
+    # 按实际解码的片段检测编码 课程表可能远在文件开头之后
+    pieces = [buffer[start:end] for start, end in sorted(pieces)]
+    encoding = detect_encoding(buffer, pieces)
+    return ''.join(piece.decode(encoding, errors='replace')
+                   for piece in pieces)
+
+
+# 打开课程表文件
+@contextmanager
+def open_export(file_path, engine='full', profiler=None):
+    """
+    打开课程表文件 mmap引擎时返回只读的内存映射 退出时释放 其余引擎返回文件内容
+    Args:
+        file_path (str): 课程表文件路径
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        profiler (StageProfiler): 性能记录 为None时不记录
+    Yields:
+        bytes | mmap.mmap: 文件内容
+    """
+    with open(file_path, 'rb') as f:
+        if engine != 'mmap':
+            with profile_stage(profiler, 'read'):
+                html = f.read()
+            yield html
+            return
+        with profile_stage(profiler, 'read'):
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空文件不能映射
+                buffer = None
+        if buffer is None:
+            yield b''
+            return
+        with buffer:
+            yield buffer
+
+
+# 使用指定的解析引擎构建BeautifulSoup对象
+def build_soup(html: bytes, engine: str = 'full') -> BeautifulSoup:
+    """
+    使用指定的解析引擎构建BeautifulSoup对象
+    Args:
+        html (bytes): html文件内容
+        engine (str): 解析引擎 见 PARSER_ENGINES
+    Returns:
+        BeautifulSoup: html文件的BeautifulSoup对象
+    """
+    if engine == 'fast':
+        return BeautifulSoup(html, FAST_PARSER,
+                             parse_only=COURSE_TABLE_STRAINER)
+    if engine == 'mmap':
+        return BeautifulSoup(extract_course_html(html) or '', FAST_PARSER)
+    return BeautifulSoup(html, 'html.parser')
+
 
 # 获取html页面文件
-def read_html_file(file_path: str) -> BeautifulSoup:
+def read_html_file(file_path: str, engine: str = 'full') -> BeautifulSoup:
     """
     读取html文件
     从剪切板读取html文件
     如果读取失败则手动选择html文件
+    Args:
+        file_path (str): html文件路径
+        engine (str): 解析引擎 见 PARSER_ENGINES 得到的课程表相同
     Returns:
         BeautifulSoup: html文件的BeautifulSoup对象
     """
+    if engine not in PARSER_ENGINES:
+        raise ValueError(f"未知的解析引擎: {engine}")
     try:
         # 读取html文件
         with open(file_path, 'rb') as file:
             html = file.read()
         # 从html中解析课程表
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = build_soup(html, engine)
         soup_course_table = soup.find(id='manualArrangeCourseTable')
         if soup_course_table == None:
             logging.error("文件中不存在课程表")
             return None
     except Exception as e:
-        logging.error("读取文件失败", e)
+        logging.error("读取文件失败: %s", e)
         return None
     return soup
 
@@ -58,79 +291,200 @@ def parse_soup_to_table(soup: BeautifulSoup) -> list[list]:
         list: 课程表的二维列表
     """
     try:
-        # 定义课程表的二维列表
-        table = []
         # 获取所有课程
         soup_course_table = soup.find(id='manualArrangeCourseTable')
-        course_list = soup_course_table.find_all('tr')
-        # 获取表头
-        thead = course_list[0]
-        # 获取表头中的所有列
-        th = thead.find_all('th')
-        # 将表头中的单元格内容添加到table中
-        table.append([header.text.strip() for header in th])
-        # 获取表格主体中的所有课程
-        tbody = course_list[1:]
-        for course in tbody:
-            tabletr = []
-            # 获取课程中的所有列
-            course_name = course.find_all('td')
-            for course_name in course_name:
-                # 获取课程详细信息
-                tabletr.append(course_name.text.strip())
-            # 如果tabletr[1:]中全为''则删除tabletr
-            # 如果列表长度小于8则填充''
-            if len(tabletr) < 8:
-                tabletr.extend([''] * (8 - len(tabletr)))
-            table.append(tabletr)
+        header, rows = parse_course_table(soup_course_table)
     except Exception as e:
-        logging.error("解析课程表失败", e)
+        logging.error("解析课程表失败: %s", e)
         return []
-    return table
+    return [header] + rows
+
+
+# 解析课程表标签
+def parse_course_table(soup_course_table) -> tuple[list, list[list]]:
+    """
+    解析课程表标签中的表头和表格主体
+    Args:
+        soup_course_table (Tag): 课程表的table标签
+    Returns:
+        tuple: 表头列表和表格主体的二维列表
+    """
+    course_list = soup_course_table.find_all('tr')
+    # 获取表头
+    thead = course_list[0]
+    # 获取表头中的所有列
+    th = thead.find_all('th')
+    # 将表头中的单元格内容添加到table中
+    header = [header.text.strip() for header in th]
+    rows = []
+    # 获取表格主体中的所有课程
+    tbody = course_list[1:]
+    for course in tbody:
+        tabletr = []
+        # 获取课程中的所有列
+        course_name = course.find_all('td')
+        for course_name in course_name:
+            # 获取课程详细信息
+            tabletr.append(course_name.text.strip())
+        # 如果列表长度小于8则填充''
+        if len(tabletr) < 8:
+            tabletr.extend([''] * (8 - len(tabletr)))
+        rows.append(tabletr)
+    return header, rows
+
+
+# 课程表解析结果
+@dataclass
+class CourseExport:
+    """
+    一次遍历得到的课程表解析结果
+    Attributes:
+        calendar_name (str): 日历名称 即h3标题
+        header (list): 表头
+        rows (list): 表格主体的二维列表
+    """
+    calendar_name: str
+    header: list
+    rows: list
+
+    @property
+    def table(self) -> list[list]:
+        """与 parse_soup_to_table 相同格式的二维列表"""
+        return [self.header] + self.rows
+
+
+# 一次遍历解析课程表
+def parse_soup(soup: BeautifulSoup) -> CourseExport:
+    """
+    遍历一次文档树 同时获取日历名称和课程表
+    Args:
+        soup (BeautifulSoup): html文件的BeautifulSoup对象
+    Returns:
+        CourseExport: 解析结果 不存在课程表时返回None
+    """
+    calendar_name = None
+    soup_course_table = None
+    for tag in soup.find_all(['h3', 'table']):
+        if (tag.name == 'h3' and calendar_name is None
+                and tag.get('align') == 'center'):
+            calendar_name = tag.text
+        elif (tag.name == 'table' and soup_course_table is None
+              and tag.get('id') == 'manualArrangeCourseTable'):
+            soup_course_table = tag
+        if calendar_name is not None and soup_course_table is not None:
+            break
+    if soup_course_table is None:
+        logging.error("文件中不存在课程表")
+        return None
+    try:
+        header, rows = parse_course_table(soup_course_table)
+    except Exception as e:
+        logging.error("解析课程表失败: %s", e)
+        return None
+    return CourseExport(calendar_name or '', header, rows)
+
+
+# 读取并解析课程表文件
+def read_course_export(file_path: str, engine: str = 'full') -> CourseExport:
+    """
+    读取html文件并一次解析出日历名称和课程表
+    Args:
+        file_path (str): html文件路径
+        engine (str): 解析引擎 见 PARSER_ENGINES
+    Returns:
+        CourseExport: 解析结果 失败时返回None
+    """
+    if engine not in PARSER_ENGINES:
+        raise ValueError(f"未知的解析引擎: {engine}")
+    try:
+        with open_export(file_path, engine) as html:
+            soup = build_soup(html, engine)
+    except Exception as e:
+        logging.error("读取文件失败: %s", e)
+        return None
+    return parse_soup(soup)
+
+
+# 周数表达式中的一项 如 单1-9 双2-4 7 6-12
+WEEK_TOKEN_PATTERN = re.compile(r'\s*(单|双)?(\d+)(?:-(\d+))?\s*')
 
 
 # 双2-4 7,1-11,1-6 8-12,单1-9,1 3-4 6-12
 # 解析周数
-def parse_week(week_str: str) -> list:
+@lru_cache(maxsize=4096)
+def parse_week(week_str: str) -> tuple:
     """
     解析周数
+    相同的周数字符串在课程表中大量重复 结果会被缓存
     Args:
         week_str (str): 周数字符串
     Returns:
-        list: 周数列表
+        tuple: 升序的周数元组
+    Raises:
+        ValueError: 无法解析的周数字符串
     """
-    # 定义周数列表
     week_list = []
     # 空格分割字符串
-    week_str = week_str.split(' ')
-    for week in week_str:
-        # 如果字符串中包含 单
-        if '单' in week:
-            # 去除单字
-            week = week.replace('单', '')
-            if '-' in week:
-                week = week.split('-')
-                for i in range(int(week[0]), int(week[1]) + 1, 2):
-                    week_list.append(i)
-            else:
-                week_list.append(int(week))
-        elif '双' in week:
-            # 去除双字
-            week = week.replace('双', '')
-            if '-' in week:
-                week = week.split('-')
-                for i in range(int(week[0]), int(week[1]) + 1, 2):
-                    week_list.append(i)
-            else:
-                week_list.append(int(week))
-        elif '-' in week:
-            week = week.split('-')
-            for i in range(int(week[0]), int(week[1]) + 1):
-                week_list.append(i)
+    for token in week_str.split(' '):
+        match = WEEK_TOKEN_PATTERN.fullmatch(token)
+        if match is None:
+            raise ValueError(f"无法解析周数: {token!r}")
+        parity, start, end = match.groups()
+        if end is None:
+            week_list.append(int(start))
         else:
-            week_list.append(int(week))
-    week_list = sorted(week_list)
-    return week_list
+            # 单双周每隔一周上课
+            step = 2 if parity else 1
+            week_list.extend(range(int(start), int(end) + 1, step))
+    return tuple(sorted(week_list))
+
+
+# 全角括号和逗号统一转换为半角
+COURSE_CELL_TRANSLATION = str.maketrans('（），', '(),')
+# 课程代码 如 (B12345) 只匹配B加数字 以免删除以B开头的教师
+COURSE_CODE_PATTERN = re.compile(r'\(B\d+\)')
+# 教师和地点中可以包含一层括号 如 张三(外聘) 教学楼(东)101
+NESTED_GROUP = r'(?:[^()]|\([^()]*\))*'
+# 一门课程: 名称(教师)(周数,地点)
+# 名称最短匹配 其中可以包含括号 如 高等数学(上)
+COURSE_PATTERN = re.compile(
+    rf'(?P<name>.+?)\((?P<teacher>{NESTED_GROUP})\)\s*'
+    rf'\((?P<week>[^(),]*),(?P<location>{NESTED_GROUP})\)', re.DOTALL)
+# 课程名称中出现相邻的括号组 说明前面有一门无法解析的课程被并入了名称
+COURSE_NAME_GROUPS_PATTERN = re.compile(r'\)\s*\(')
+
+
+# 切分课程字符串
+@lru_cache(maxsize=8192)
+def tokenize_course_cell(course_str: str) -> tuple:
+    """
+    一次扫描切分单元格中的所有课程
+    相同的单元格在多个班级的课程表中大量重复 结果会被缓存
+    Args:
+        course_str (str): 课程字符串
+    Returns:
+        tuple: (名称, 教师, 周数元组, 地点) 的元组
+    Raises:
+        ValueError: 无法解析的周数或课程
+    """
+    course_str = COURSE_CODE_PATTERN.sub(
+        '', course_str.translate(COURSE_CELL_TRANSLATION))
+    courses = []
+    end = 0
+    for match in COURSE_PATTERN.finditer(course_str):
+        name, teacher, week, location = match.groups()
+        if (course_str[end:match.start()].strip()
+                or COURSE_NAME_GROUPS_PATTERN.search(name)):
+            raise ValueError(f"无法解析课程: "
+                             f"{course_str[end:match.end()].strip()!r}")
+        # 地点中有多个逗号时只取第一段
+        courses.append((name.strip(), teacher.strip(),
+                        parse_week(week.strip()),
+                        location.split(',', 1)[0].strip()))
+        end = match.end()
+    if course_str[end:].strip():
+        raise ValueError(f"无法解析课程: {course_str[end:].strip()!r}")
+    return tuple(courses)
 
 
 # 解析课程字符串
@@ -142,62 +496,103 @@ def parse_course_str_to_list(course_str: str) -> list:
     Returns:
         list: 课程列表
     """
-    course_list = []
-    # print(course_str.strip())
-    # 删除字符串中所有'(B'到')'之间的内容
-    # 使用 re.sub 替换匹配的内容为空字符串
-    course_str = re.sub(r"\(B.*?\)", "", course_str)
-    # 按( ) , 分割字符串
-    parts = re.split(r'[()]', course_str)
-    # 删除空字符串
-    parts = [part for part in parts if part.strip()]
-    # 使用字典存储课程信息
-    course_dict = {}
-    for i, part in enumerate(parts):
-        if (i % 3 == 0):
-            course_dict['name'] = part.strip()
-        elif (i % 3 == 1):
-            course_dict['teacher'] = part.strip()
-        elif (i % 3 == 2):
-            parts = re.split(r'[,]', part)
-            week_list = parse_week(parts[0].strip())
-            course_dict['week'] = week_list
-            course_dict['location'] = parts[1].strip()
-            course_list.append(course_dict)
-            course_dict = {}
-    return course_list
+    return [{'name': name, 'teacher': teacher, 'week': week,
+             'location': location}
+            for name, teacher, week, location in
+            tokenize_course_cell(course_str)]
+
+
+# 课程记录
+class Course(NamedTuple):
+    """
+    课程记录 在解析课程表时生成一次 之后各阶段直接使用
+    Attributes:
+        name (str): 课程名称
+        teacher (str): 教师
+        location (str): 上课地点
+        week (tuple): 升序的上课周数
+        weekday (int): 星期数 1-7
+        period (int): 开始节数 1-11
+    """
+    name: str
+    teacher: str
+    location: str
+    week: tuple
+    weekday: int
+    period: int
+
+
+# 单元格解析错误
+class ParseDiagnostic(NamedTuple):
+    """
+    容错解析时无法解析的单元格或行
+    Attributes:
+        row (int): 表格主体中的行号 从1开始
+        column (int): 列号 0为节次列 1-7为星期一至星期日
+        period (str): 该行的节次名称
+        weekday (str): 该列的表头
+        cell (str): 单元格内容
+        error (str): 错误信息
+    """
+    row: int
+    column: int
+    period: str
+    weekday: str
+    cell: str
+    error: str
 
 
 # 解析课程表格
-def table_to_list(table: list) -> list:
+def table_to_list(table: list, parse_cell=parse_course_str_to_list,
+                  diagnostics=None) -> list[Course]:
     """
     将课程表格解析为课程列表
     Args:
         table (list): 课程表格的二维列表
+        parse_cell (callable): 单元格解析函数 默认为 parse_course_str_to_list
+        diagnostics (list): 传入列表时为容错模式 无法解析的单元格或行记录到
+            该列表后跳过 其余课程照常输出 为None时遇到错误直接抛出异常
     Returns:
-        list: 课程列表
+        list: 课程记录列表
     """
     course_end_list = []
-    # 删除表头
-    # table.pop(0)
-    # 删除表格中没有课程的行 删除row[1:]中全为''的行
-    table = [row for row in table if any(row[1:])]
-    # 遍历table中的每一行 不包含表头
-    for row, course in enumerate(table[1:]):
+    header = table[0]
+    # 遍历table中的每一行 不包含表头 跳过row[1:]中全为''的行
+    # 星期和节次在这里转换为数字 之后不再查表
+    for row, course in enumerate(table[1:], 1):
+        if not any(course[1:]):
+            continue
+        try:
+            period = PERIOD_NUMBERS[course[0]]
+        except KeyError:
+            if diagnostics is None:
+                raise
+            diagnostics.append(ParseDiagnostic(
+                row, 0, course[0], header[0], course[0],
+                f"未知的节次: {course[0]!r}"))
+            continue
         # 遍历每一行中的每一列
         for col, course_name in enumerate(course):
-            # print(col,course_name)
             if col > 0 and course_name != '':
-                course_dict_list = parse_course_str_to_list(course_name)
-                for course_dict in course_dict_list:
-                    course_end_list.append({
-                        'name': course_dict['name'],
-                        'teacher': course_dict['teacher'],
-                        'location': course_dict['location'],
-                        'week': course_dict['week'],
-                        'weekday': table[0][col],
-                        'period': table[row + 1][0]
-                    })
+                try:
+                    course_dict_list = parse_cell(course_name)
+                    courses = [
+                        Course(sys.intern(course_dict['name']),
+                               sys.intern(course_dict['teacher']),
+                               sys.intern(course_dict['location']),
+                               course_dict['week'],
+                               WEEKDAY_NUMBERS[header[col]], period)
+                        for course_dict in course_dict_list
+                    ]
+                except Exception as e:
+                    if diagnostics is None:
+                        raise
+                    diagnostics.append(ParseDiagnostic(
+                        row, col, course[0],
+                        header[col] if col < len(header) else '',
+                        course_name, f"{type(e).__name__}: {e}"))
+                    continue
+                course_end_list.extend(courses)
     return course_end_list
 
 
@@ -220,6 +615,22 @@ def calculate_course_start_datetime(course_start_date, week_num, weekday,
     return course_time
 
 
+# 夏季作息时间 5月至9月
+SUMMER_SCHEDULE = tuple(
+    datetime.time(hour, minute)
+    for hour, minute in ((8, 0), (9, 0), (10, 10), (11, 10), (14, 30),
+                         (15, 30), (16, 40), (17, 40), (19, 30), (20, 30),
+                         (21, 30)))
+# 冬季作息时间
+WINTER_SCHEDULE = tuple(
+    datetime.time(hour, minute)
+    for hour, minute in ((8, 0), (9, 0), (10, 10), (11, 10), (14, 00),
+                         (15, 00), (16, 10), (17, 10), (19, 00), (20, 00),
+                         (21, 00)))
+# 每次课的时长
+CLASS_DURATION = datetime.timedelta(hours=1, minutes=50)
+
+
 # 课程时间表
 def course_scheduled(course_date, course_period) -> datetime.datetime:
     """
@@ -230,71 +641,200 @@ def course_scheduled(course_date, course_period) -> datetime.datetime:
     Returns:
         datetime.datetime: 课程日期和开始时间
     """
-    scheduled_datatime = []
-    summer_schedule = [[8, 0], [9, 0], [10, 10], [11, 10], [14, 30], [15, 30],
-                       [16, 40], [17, 40], [19, 30], [20, 30], [21, 30]]
-    winter_schedule = [[8, 0], [9, 0], [10, 10], [11, 10], [14, 00], [15, 00],
-                       [16, 10], [17, 10], [19, 00], [20, 00], [21, 00]]
     if course_date.month >= 5 and course_date.month < 10:
-        for summer_time in summer_schedule:
-            scheduled_datatime.append(
-                datetime.time(summer_time[0], summer_time[1], 0))
+        schedule = SUMMER_SCHEDULE
     else:
-        for winter_time in winter_schedule:
-            scheduled_datatime.append(
-                datetime.time(winter_time[0], winter_time[1], 0))
-    return datetime.datetime.combine(course_date.date(),
-                                     scheduled_datatime[course_period - 1])
+        schedule = WINTER_SCHEDULE
+    if isinstance(course_date, datetime.datetime):
+        course_date = course_date.date()
+    return datetime.datetime.combine(course_date, schedule[course_period - 1])
 
 
 # 计算课程开始时间
-def calculate_course_start_time(course_start_date, course_dict) -> list:
+def calculate_course_start_time(course_start_date, course: Course) -> list:
     """
     计算课程开始时间
     Args:
         course_start_date (datetime.datetime): 学期开始日期时间
-        course_dict (dict): 课程字典
+        course (Course): 课程记录
     Returns:
         list: 课程开始时间列表
     """
-    weekday_dict = {
-        '星期一': 1,
-        '星期二': 2,
-        '星期三': 3,
-        '星期四': 4,
-        '星期五': 5,
-        '星期六': 6,
-        '星期日': 7
-    }
-    weekday = weekday_dict[course_dict['weekday']]
-    period_dict = {
-        '第一节': 1,
-        '第二节': 2,
-        '第三节': 3,
-        '第四节': 4,
-        '第五节': 5,
-        '第六节': 6,
-        '第七节': 7,
-        '第八节': 8,
-        '第九节': 9,
-        '第十节': 10,
-        '第十一节': 11
-    }
-    period = period_dict[course_dict['period']]
     course_start_time_list = []
-    for week in course_dict['week']:
+    for week in course.week:
         # 当前日期时间等于学期开始日期时间加上（周数-1）*7
-        current_week_datetime = course_start_date + datetime.timedelta(
-            weeks=week - 1)
-        current_date = current_week_datetime + datetime.timedelta(
-            days=weekday - 1)
-        current_datetime = course_scheduled(current_date, period)
-        # print(current_datetime)
+        current_date = course_start_date + datetime.timedelta(
+            weeks=week - 1, days=course.weekday - 1)
+        current_datetime = course_scheduled(current_date, course.period)
         course_start_time_list.append(current_datetime)
-        # 计算课程开始日期
     return course_start_time_list
 
 
+# 作息时间规则
+@dataclass(frozen=True)
+class ScheduleRule:
+    """
+    一段日期内的作息时间
+    Attributes:
+        periods (tuple): 每节课的 (开始时间, 时长) 元组
+        start (tuple): 起始 (月, 日) 为None时匹配所有日期
+        end (tuple): 结束 (月, 日) 包含当天 可以跨年 如10-01至04-30
+    """
+    periods: tuple
+    start: tuple = None
+    end: tuple = None
+
+    def matches(self, month_day: tuple) -> bool:
+        if self.start is None:
+            return True
+        if self.start <= self.end:
+            return self.start <= month_day <= self.end
+        return month_day >= self.start or month_day <= self.end
+
+
+# 作息时间配置
+@dataclass(frozen=True)
+class ScheduleProfile:
+    """
+    一个校区的作息时间配置 按顺序匹配第一条日期范围包含上课日期的规则
+    创建时将一年中每天对应的规则编译为查找表 查询上课时间不再遍历规则
+    Attributes:
+        name (str): 配置名称
+        rules (tuple): ScheduleRule 元组
+    Raises:
+        ValueError: 规则没有包含一年中的每一天
+    """
+    name: str
+    rules: tuple
+
+    def __post_init__(self):
+        # 以闰年列举一年中的每一天
+        day_rules = {}
+        day = datetime.date(2000, 1, 1)
+        while day.year == 2000:
+            month_day = (day.month, day.day)
+            for rule in self.rules:
+                if rule.matches(month_day):
+                    day_rules[month_day] = rule.periods
+                    break
+            else:
+                raise ValueError(f"{self.name}: 没有规则包含 "
+                                 f"{day.month:02d}-{day.day:02d}")
+            day += datetime.timedelta(days=1)
+        object.__setattr__(self, '_day_rules', day_rules)
+
+    def slot(self, course_date: datetime.date, period: int) -> tuple:
+        """
+        查询某天某节课的开始和结束时间
+        Args:
+            course_date (datetime.date): 上课日期
+            period (int): 节数 从1开始
+        Returns:
+            tuple: (开始时间, 结束时间)
+        Raises:
+            KeyError: 没有规则包含该日期
+        """
+        start_time, duration = self._day_rules[(course_date.month,
+                                                course_date.day)][period - 1]
+        start = datetime.datetime.combine(course_date, start_time)
+        return start, start + duration
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> 'ScheduleProfile':
+        """
+        从配置字典创建作息时间配置 格式如下
+        {
+            "duration": 110,
+            "rules": [
+                {"start": "05-01", "end": "09-30",
+                 "periods": ["08:00", "09:00", ...],
+                 "durations": [45, 45, ...]},
+                {"periods": ["08:00", "09:00", ...]}
+            ]
+        }
+        duration 为默认每次课的分钟数 durations 可以为每节课单独指定
+        """
+        default_duration = data.get('duration', 110)
+        rules = []
+        for rule in data['rules']:
+            durations = rule.get('durations',
+                                 [rule.get('duration', default_duration)] *
+                                 len(rule['periods']))
+            if len(durations) != len(rule['periods']):
+                raise ValueError(f"{name}: durations 与 periods 数量不一致")
+            periods = tuple(
+                (datetime.time.fromisoformat(start),
+                 datetime.timedelta(minutes=minutes))
+                for start, minutes in zip(rule['periods'], durations))
+            if 'start' in rule:
+                start = tuple(map(int, rule['start'].split('-')))
+                end = tuple(map(int, rule['end'].split('-')))
+                rules.append(ScheduleRule(periods, start, end))
+            else:
+                rules.append(ScheduleRule(periods))
+        return cls(name, tuple(rules))
+
+
+# 默认作息时间 与 course_scheduled 相同
+DEFAULT_SCHEDULE_PROFILE = ScheduleProfile('默认', (
+    ScheduleRule(tuple((start, CLASS_DURATION) for start in SUMMER_SCHEDULE),
+                 (5, 1), (9, 30)),
+    ScheduleRule(tuple((start, CLASS_DURATION) for start in WINTER_SCHEDULE)),
+))
+
+
+# 读取作息时间配置文件
+def load_schedule_profiles(file_path) -> dict:
+    """
+    读取作息时间配置文件
+    文件内容为 {"profiles": {"校区名称": 配置字典, ...}} 配置字典格式见 ScheduleProfile.from_dict
+    Args:
+        file_path (str): JSON配置文件路径
+    Returns:
+        dict: 配置名称到 ScheduleProfile 的字典
+    Raises:
+        ValueError: 配置无效 如规则没有包含一年中的每一天
+    """
+    with open(file_path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        name: ScheduleProfile.from_dict(name, profile)
+        for name, profile in data['profiles'].items()
+    }
+
+
+# 批量计算学期内所有课程的上课时间
+def calculate_term_occurrences(course_start_date, course_list,
+                               profile=None) -> list:
+    """
+    一次计算学期内所有课程的上课开始和结束时间
+    同一(周数, 星期, 节次)只计算一次 部门课表中大量课程共用相同的时间段
+    Args:
+        course_start_date (datetime.datetime): 学期开始日期
+        course_list (list): 课程记录列表
+        profile (ScheduleProfile): 作息时间配置 默认为 DEFAULT_SCHEDULE_PROFILE
+    Returns:
+        list: 与course_list一一对应的 [(开始时间, 结束时间), ...] 列表
+    """
+    if profile is None:
+        profile = DEFAULT_SCHEDULE_PROFILE
+    start_date = course_start_date.date()
+    slots = {}
+    occurrence_list = []
+    for course in course_list:
+        occurrences = []
+        for week in course.week:
+            key = (week, course.weekday, course.period)
+            slot = slots.get(key)
+            if slot is None:
+                course_date = start_date + datetime.timedelta(
+                    weeks=week - 1, days=course.weekday - 1)
+                slot = slots[key] = profile.slot(course_date, course.period)
+            occurrences.append(slot)
+        occurrence_list.append(occurrences)
+    return occurrence_list
+
+
 # 初始化日历
 def init_calendar(calendar_name) -> Calendar:
     # 创建日历对象
@@ -308,27 +848,237 @@ def init_calendar(calendar_name) -> Calendar:
     return cal
 
 
+# 课程事件的UID
+def course_event_uid(course: Course, week, date_time, repeat=0) -> str:
+    """
+    根据课程名称 教师 星期 节次 周数和学期开始日期生成稳定的UID
+    重新转换同一学期时UID不变 调整地点或上课时间后日历客户端据此更新已有事件
+    不同学期的同一门课程UID不同 其余字段相同的记录用repeat区分
+    Args:
+        course (Course): 课程记录
+        week (int): 周数
+        date_time (datetime.datetime): 该周的上课时间 用于推算学期开始日期
+        repeat (int): 整个日历中相同字段的第几次出现 从0开始
+    """
+    term_start = date_time.date() - datetime.timedelta(
+        weeks=week - 1, days=course.weekday - 1)
+    fields = (course.name, course.teacher, course.weekday, course.period,
+              week, f'{term_start:%Y%m%d}')
+    if repeat:
+        fields += (repeat,)
+    identity = '\x1f'.join(map(str, fields))
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest() + '@class2ics'
+
+
+# 课程事件UID的重复计数键
+def course_repeat_key(course: Course, week) -> tuple:
+    return course.name, course.teacher, course.weekday, course.period, week
+
+
+# 课程每次上课的UID
+def course_event_uids(course: Course, date_time_list, repeats: Counter) -> list:
+    """
+    按课程的周数依次生成每次上课的UID 并更新日历范围的重复计数
+    合并日历中只有地点不同的记录 以及同一周重复的上课时间由计数区分
+    Args:
+        course (Course): 课程记录
+        date_time_list (list): 课程开始时间列表 与课程的周数一一对应
+        repeats (Counter): 整个日历共用的重复计数 键见 course_repeat_key
+    Returns:
+        list: 与上课时间一一对应的UID列表
+    """
+    uids = []
+    for week, date_time in zip(course.week, date_time_list):
+        key = course_repeat_key(course, week)
+        uids.append(course_event_uid(course, week, date_time, repeats[key]))
+        repeats[key] += 1
+    return uids
+
+
+# 按上课时间分组的UID
+def _uids_by_time(date_time_list, uids) -> dict:
+    grouped = {}
+    for date_time, uid in zip(date_time_list, uids):
+        grouped.setdefault(date_time, []).append(uid)
+    return grouped
+
+
+# 周事件的UID
+def week_event_uid(week_num, course_start_date) -> str:
+    return f'week-{week_num}-{course_start_date:%Y%m%d}@class2ics'
+
+
+# 转换为UTC时间
+def utc_dtstamp(dtstamp: datetime.datetime) -> datetime.datetime:
+    """
+    没有时区的时间视为UTC时间
+    """
+    if dtstamp.tzinfo is None:
+        return dtstamp.replace(tzinfo=datetime.timezone.utc)
+    return dtstamp.astimezone(datetime.timezone.utc)
+
+
+# 创建课程事件
+def create_course_event(course: Course, date_time, end_time=None, uid=None,
+                        dtstamp=None) -> Event:
+    # 创建事件对象
+    event = Event()
+    # 设置事件的名称
+    event.add('summary', course.name)
+    # 设置事件的开始时间和结束时间
+    event.add('dtstart', date_time)
+    if end_time is None:
+        end_time = date_time + CLASS_DURATION
+    event.add('dtend', end_time)
+    # 设置事件的UID和时间戳
+    if uid is not None:
+        event.add('uid', uid)
+    if dtstamp is not None:
+        event.add('dtstamp', utc_dtstamp(dtstamp))
+    # 设置事件的地点
+    event.add('location', course.location)
+    # 设置事件的描述
+    event.add('description', course.teacher)
+    return event
+
+
 # 添加课程事件
-def add_course_event(cal, course_dict, date_time_list):
+def add_course_event(cal, course: Course, date_time_list, end_time_list=None,
+                     dtstamp=None, repeats=None):
+    # 未指定结束时间时按默认课程时长计算
+    if end_time_list is None:
+        end_time_list = [None] * len(date_time_list)
+    # 未传入日历范围的计数时只在本课程内区分重复
+    if repeats is None:
+        repeats = Counter()
+    uids = course_event_uids(course, date_time_list, repeats)
     # 添加课程事件
-    for date_time in date_time_list:
-        # 创建事件对象
-        event = Event()
-        # 设置事件的名称
-        event.add('summary', course_dict['name'])
-        # 设置事件的开始时间和结束时间
-        event.add('dtstart', date_time)
-        event.add('dtend', date_time + datetime.timedelta(hours=1, minutes=50))
-        # 设置事件的地点
-        event.add('location', course_dict['location'])
-        # 设置事件的描述
-        event.add('description', course_dict['teacher'])
+    for date_time, end_time, uid in zip(date_time_list, end_time_list, uids):
         # 将事件添加到日历中
+        cal.add_component(create_course_event(course, date_time, end_time,
+                                              uid, dtstamp))
+
+
+# 将上课时间分组为重复规则
+def course_rrule_groups(date_time_list, end_time_list=None) -> list:
+    """
+    将一门课程的所有上课时间分组为每周或每两周的重复规则
+    不同日期范围的上课时间和时长可能不同 按开始时间和时长分组 每组对应一个重复规则
+    单双周每两周重复 否则每周重复 不上课的周作为排除日期
+    Args:
+        date_time_list (list): 课程开始时间列表
+        end_time_list (list): 课程结束时间列表 默认按课程时长计算
+    Returns:
+        list: (首次上课时间, 间隔周数, 次数, 排除日期列表, 重复的上课时间列表) 列表
+    """
+    if end_time_list is None:
+        end_time_list = [date_time + CLASS_DURATION
+                         for date_time in date_time_list]
+    rules = []
+    groups = {}
+    for date_time, end_time in zip(date_time_list, end_time_list):
+        groups.setdefault((date_time.time(), end_time - date_time),
+                          []).append(date_time)
+    for group in groups.values():
+        unique = sorted(set(group))
+        # 重复的上课时间无法用重复规则表示 需要单独添加
+        duplicates = sorted((Counter(group) - Counter(unique)).elements())
+        first = unique[0]
+        offsets = [(date_time - first).days // 7 for date_time in unique]
+        if len(offsets) > 1 and all(offset % 2 == 0 for offset in offsets):
+            interval = 2
+        else:
+            interval = 1
+        count = offsets[-1] // interval + 1
+        present = set(offsets)
+        exdates = [
+            first + datetime.timedelta(weeks=i * interval)
+            for i in range(count) if i * interval not in present
+        ]
+        rules.append((first, interval, count, exdates, duplicates))
+    return rules
+
+
+# 添加重复规则课程事件
+def add_course_rrule_event(cal, course: Course, date_time_list,
+                           end_time_list=None, dtstamp=None, repeats=None):
+    """
+    将一门课程的所有上课时间合并为重复规则事件 分组规则见 course_rrule_groups
+    重复规则事件的UID取首次上课的UID 重复的上课时间依次取该时间后续的UID
+    Args:
+        cal (Calendar): 日历对象
+        course (Course): 课程记录
+        date_time_list (list): 课程开始时间列表 与课程的周数一一对应
+        end_time_list (list): 课程结束时间列表 默认按课程时长计算
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+        repeats (Counter): 整个日历共用的重复计数 为None时只在本课程内计数
+    """
+    durations = {}
+    if end_time_list is not None:
+        durations = {
+            date_time: end_time - date_time
+            for date_time, end_time in zip(date_time_list, end_time_list)
+        }
+    if repeats is None:
+        repeats = Counter()
+    uids = _uids_by_time(date_time_list,
+                         course_event_uids(course, date_time_list, repeats))
+    for first, interval, count, exdates, duplicates in course_rrule_groups(
+            date_time_list, end_time_list):
+        seen = Counter()
+        for date_time in duplicates:
+            seen[date_time] += 1
+            cal.add_component(create_course_event(
+                course, date_time,
+                date_time + durations.get(date_time, CLASS_DURATION),
+                uids[date_time][seen[date_time]], dtstamp))
+        event = create_course_event(
+            course, first, first + durations.get(first, CLASS_DURATION),
+            uids[first][0], dtstamp)
+        if count > 1:
+            event.add('rrule', {
+                'freq': 'weekly',
+                'interval': interval,
+                'count': count
+            })
+        if exdates:
+            event.add('exdate', exdates)
         cal.add_component(event)
 
 
+# 展开日历中的所有事件
+def expand_calendar_events(ical: bytes) -> Counter:
+    """
+    将日历中的事件按重复规则展开为单次事件
+    用于校验不同输出方式生成的日历内容一致
+    Args:
+        ical (bytes): ICS文件内容
+    Returns:
+        Counter: (名称, 开始时间, 结束时间, 地点, 描述) 的计数
+    """
+    occurrences = Counter()
+    for event in Calendar.from_ical(ical).walk('VEVENT'):
+        dtstart = event.decoded('dtstart')
+        duration = event.decoded('dtend') - dtstart
+        key = (str(event.get('summary')), str(event.get('location', '')),
+               str(event.get('description', '')))
+        if 'rrule' in event:
+            rule = rrulestr(event['rrule'].to_ical().decode(), dtstart=dtstart)
+            starts = set(rule)
+            exdate = event.get('exdate', [])
+            if not isinstance(exdate, list):
+                exdate = [exdate]
+            for dates in exdate:
+                starts -= {date.dt for date in dates.dts}
+        else:
+            starts = [dtstart]
+        for start in starts:
+            occurrences[(key[0], start, start + duration) + key[1:]] += 1
+    return occurrences
+
+
 # 添加周事件
-def add_week_event(cal, week_num, course_start_date):
+def add_week_event(cal, week_num, course_start_date, dtstamp=None):
     # 创建事件对象
     event = Event()
     # 设置事件的名称
@@ -338,111 +1088,2122 @@ def add_week_event(cal, week_num, course_start_date):
     event.add('dtstart',
               course_start_date + datetime.timedelta(weeks=week_num - 1))
     event.add('dtend', course_start_date + datetime.timedelta(weeks=week_num))
+    # 设置事件的UID和时间戳
+    event.add('uid', week_event_uid(week_num, course_start_date))
+    if dtstamp is not None:
+        event.add('dtstamp', utc_dtstamp(dtstamp))
     # 设置事件的地点
     event.add('location', '学校')
     # 将事件添加到日历中
     cal.add_component(event)
 
 
-# 写入字符串到日历文件
-def write_calendar_file(str, calendar_name):
-    try:
-        # 读取当前目录下的所有ics文件
-        current_dir = Path(__file__).resolve().parent
-        # 读取当前目录下的所有ics文件
-        ics_files = current_dir.glob('*.ics')
-        # 遍历ics文件列表
-        for ics_file in ics_files:
+# 转义TEXT类型的属性值
+def escape_text(text: str) -> str:
+    """
+    按RFC 5545转义TEXT类型的属性值 与icalendar的转义规则相同
+    Args:
+        text (str): 属性值
+    Returns:
+        str: 转义后的属性值
+    """
+    return (text.replace('\\N', '\n').replace('\\', '\\\\')
+            .replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n')
+            .replace('\r', '\\n'))
+
+
+# 折行
+def fold_line(line: str, limit: int = 75) -> bytes:
+    """
+    按RFC 5545将内容行折为不超过75字节的多行 不拆分多字节字符和转义序列
+    Args:
+        line (str): 内容行
+        limit (int): 每行字节数上限
+    Returns:
+        bytes: 以CRLF结尾的UTF-8内容行
+    """
+    data = line.encode('utf-8')
+    if len(data) < limit:
+        return data + b'\r\n'
+    folded = []
+    current = []
+    byte_count = 0
+    for char in line:
+        char_len = len(char.encode('utf-8'))
+        if current and byte_count + char_len >= limit:
+            # 不在反斜杠之后折行
+            if len(current) > 1 and current[-1] in '\\^':
+                prefix = current.pop()
+                folded.append(''.join(current))
+                current = [prefix]
+                byte_count = len(prefix.encode('utf-8'))
+            else:
+                folded.append(''.join(current))
+                current = []
+                byte_count = 0
+        current.append(char)
+        byte_count += char_len
+    folded.append(''.join(current))
+    return '\r\n '.join(folded).encode('utf-8') + b'\r\n'
+
+
+# 生成课程事件的内容行
+def course_event_lines(course: Course, date_time, recurrence=(),
+                       end_time=None, uid=None, dtstamp=None) -> list:
+    """
+    生成课程事件的内容行 属性顺序与icalendar输出相同
+    Args:
+        course (Course): 课程记录
+        date_time (datetime.datetime): 课程开始时间
+        recurrence (list): RRULE和EXDATE等重复规则内容行
+        end_time (datetime.datetime): 课程结束时间 默认按课程时长计算
+        uid (str): 事件UID 为None时不写入
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Returns:
+        list: 内容行列表
+    """
+    if end_time is None:
+        end_time = date_time + CLASS_DURATION
+    return [
+        'BEGIN:VEVENT',
+        f'SUMMARY:{escape_text(course.name)}',
+        f'DTSTART:{date_time:%Y%m%dT%H%M%S}',
+        f'DTEND:{end_time:%Y%m%dT%H%M%S}',
+        *event_identity_lines(uid, dtstamp),
+        *recurrence,
+        f'DESCRIPTION:{escape_text(course.teacher)}',
+        f'LOCATION:{escape_text(course.location)}',
+        'END:VEVENT',
+    ]
+
+
+# 生成事件UID和时间戳的内容行
+def event_identity_lines(uid=None, dtstamp=None) -> list:
+    lines = []
+    if dtstamp is not None:
+        lines.append(f'DTSTAMP:{utc_dtstamp(dtstamp):%Y%m%dT%H%M%SZ}')
+    if uid is not None:
+        lines.append(f'UID:{uid}')
+    return lines
+
+
+# 生成周事件的内容行
+def week_event_lines(week_num, course_start_date, uid=None,
+                     dtstamp=None) -> list:
+    start_date = course_start_date.date()
+    week_start = start_date + datetime.timedelta(weeks=week_num - 1)
+    week_end = start_date + datetime.timedelta(weeks=week_num)
+    return [
+        'BEGIN:VEVENT',
+        f'SUMMARY:第{week_num}周',
+        f'DTSTART;VALUE=DATE:{week_start:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{week_end:%Y%m%d}',
+        *event_identity_lines(uid, dtstamp),
+        'LOCATION:学校',
+        'END:VEVENT',
+    ]
+
+
+# 逐行生成日历内容
+def iter_calendar_lines(calendar_name, course_list, course_start_date,
+                        week_count=20, rrule=False, profile=None,
+                        dtstamp=None):
+    """
+    逐行生成与 build_calendar 相同内容的日历 不构建icalendar对象
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        profile (ScheduleProfile): 作息时间配置
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Yields:
+        str: 未折行的内容行
+    """
+    yield 'BEGIN:VCALENDAR'
+    yield 'VERSION:2.0'
+    yield f'X-WR-CALNAME:{escape_text(calendar_name)}'
+    yield 'X-WR-TIMEZONE:Asia/Shanghai'
+    occurrence_list = calculate_term_occurrences(course_start_date,
+                                                 course_list, profile)
+    repeats = Counter()
+    for course, occurrences in zip(course_list, occurrence_list):
+        starts = [start for start, _ in occurrences]
+        course_uids = course_event_uids(course, starts, repeats)
+        if not rrule:
+            for (date_time, end_time), uid in zip(occurrences, course_uids):
+                yield from course_event_lines(course, date_time,
+                                              end_time=end_time, uid=uid,
+                                              dtstamp=dtstamp)
+            continue
+        end_times = dict(occurrences)
+        uids = _uids_by_time(starts, course_uids)
+        for first, interval, count, exdates, duplicates in (
+                course_rrule_groups(starts, [end for _, end in occurrences])):
+            seen = Counter()
+            for date_time in duplicates:
+                seen[date_time] += 1
+                yield from course_event_lines(course, date_time,
+                                              end_time=end_times[date_time],
+                                              uid=uids[date_time][
+                                                  seen[date_time]],
+                                              dtstamp=dtstamp)
+            recurrence = []
+            if count > 1:
+                recurrence.append(
+                    f'RRULE:FREQ=WEEKLY;COUNT={count};INTERVAL={interval}')
+            if exdates:
+                recurrence.append('EXDATE:' + ','.join(
+                    f'{exdate:%Y%m%dT%H%M%S}' for exdate in exdates))
+            yield from course_event_lines(course, first, recurrence,
+                                          end_times[first], uids[first][0],
+                                          dtstamp)
+    for week in range(1, week_count + 1):
+        yield from week_event_lines(week, course_start_date,
+                                    week_event_uid(week, course_start_date),
+                                    dtstamp)
+    yield 'END:VCALENDAR'
+
+
+# 直接写入日历内容
+def write_calendar_stream(stream, calendar_name, course_list,
+                          course_start_date, week_count=20, rrule=False,
+                          profile=None, dtstamp=None) -> int:
+    """
+    将日历逐行写入二进制流(文件或socket.makefile('wb')) 内存占用与日历大小无关
+    Args:
+        stream: 支持write(bytes)的对象
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        profile (ScheduleProfile): 作息时间配置
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Returns:
+        int: 写入的字节数
+    """
+    size = 0
+    for line in iter_calendar_lines(calendar_name, course_list,
+                                    course_start_date, week_count, rrule,
+                                    profile, dtstamp):
+        size += stream.write(fold_line(line))
+    return size
+
+
+# 获取输出目录
+def get_output_dir(output_dir=None) -> Path:
+    # 默认保存到脚本所在目录
+    if output_dir is None:
+        return Path(__file__).resolve().parent
+    current_dir = Path(output_dir)
+    current_dir.mkdir(parents=True, exist_ok=True)
+    return current_dir
+
+
+# 日历文件索引 记录输出目录中每个日历文件的SHA-256和大小
+CALENDAR_INDEX_NAME = '.class2ics_index.json'
+
+
+# 日历文件索引
+class CalendarIndex:
+    """
+    输出目录中日历文件的内容哈希索引
+    去重和查找下一个版本号不再需要读取目录中的所有日历文件
+    """
+
+    def __init__(self, current_dir: Path, files=None, versions=None,
+                 mtimes=None):
+        self.current_dir = current_dir
+        # "sha256:大小" -> 文件名
+        self.files = files or {}
+        # 日历名称 -> 下一个版本号
+        self.versions = versions or {}
+        # 文件名 -> 登记时的修改时间(纳秒)
+        self.mtimes = mtimes or {}
+
+    @staticmethod
+    def key(digest: str, size: int) -> str:
+        return f"{digest}:{size}"
+
+    @classmethod
+    def load(cls, current_dir: Path) -> 'CalendarIndex':
+        """
+        读取索引 索引不存在或损坏时扫描目录重建
+        """
+        try:
+            with open(current_dir / CALENDAR_INDEX_NAME, encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(current_dir, data['files'], data['versions'],
+                       data.get('mtimes'))
+        except (OSError, ValueError, KeyError):
+            return cls.rebuild(current_dir)
+
+    @staticmethod
+    def file_digest(file_path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def rebuild(cls, current_dir: Path) -> 'CalendarIndex':
+        """
+        扫描目录中的所有日历文件重建索引
+        """
+        index = cls(current_dir)
+        for ics_file in current_dir.glob('*.ics'):
             # 删除空文件
             if ics_file.stat().st_size == 0:
                 ics_file.unlink()
                 continue
-            # 读取ics文件的内容
-            with open(ics_file, 'rb') as f:
-                ics_content = f.read()
-                # 如果文件内容相同则跳过
-                if str == ics_content:
-                    return ics_file
-        version = 0
-        # 写入日历文件
-        file_path = current_dir / f"{calendar_name}_V{version}.ics"
+            index.add(cls.file_digest(ics_file), ics_file.stat().st_size,
+                      ics_file)
+        return index
+
+    def lookup(self, digest: str, size: int) -> Path:
+        """
+        查找内容相同的日历文件 文件已被删除或修改(大小或修改时间变化)时移除该条目
+        旧版本的索引没有记录修改时间 此时重新计算文件的SHA-256
+        Returns:
+            Path: 日历文件路径 不存在时返回None
+        """
+        key = self.key(digest, size)
+        name = self.files.get(key)
+        if name is None:
+            return None
+        file_path = self.current_dir / name
+        try:
+            stat = file_path.stat()
+            if stat.st_size == size:
+                mtime = self.mtimes.get(name)
+                if mtime == stat.st_mtime_ns:
+                    return file_path
+                if mtime is None and self.file_digest(file_path) == digest:
+                    self.mtimes[name] = stat.st_mtime_ns
+                    return file_path
+        except OSError:
+            pass
+        del self.files[key]
+        self.mtimes.pop(name, None)
+        return None
+
+    def add(self, digest: str, size: int, file_path: Path):
+        self.files[self.key(digest, size)] = file_path.name
+        self.mtimes[file_path.name] = file_path.stat().st_mtime_ns
+
+    def next_path(self, calendar_name) -> Path:
+        """
+        获取下一个可用的日历文件路径
+        """
+        version = self.versions.get(calendar_name, 0)
+        file_path = self.current_dir / f"{calendar_name}_V{version}.ics"
         # 如果文件存在则版本号加1
         while file_path.exists():
             version += 1
-            file_path = current_dir / f"{calendar_name}_V{version}.ics"
-        with open(file_path, 'wb') as f:
-            f.write(str)
-    except Exception as e:
-        logging.error("写入日历文件失败", e)
-    return file_path
+            file_path = self.current_dir / f"{calendar_name}_V{version}.ics"
+        self.versions[calendar_name] = version + 1
+        return file_path
 
+    def save(self):
+        # 先写入临时文件再替换 避免中断时索引损坏
+        index_path = self.current_dir / CALENDAR_INDEX_NAME
+        temp_path = index_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files, 'versions': self.versions,
+                       'mtimes': self.mtimes}, f, ensure_ascii=False)
+        os.replace(temp_path, index_path)
 
-# 主函数
-def main(course_start_date: datetime.datetime, file_path: str):
 
-    # 读取html文件
-    soup = read_html_file(file_path)
-    if soup == None or soup == -1:
-        logging.error("文件读取失败")
-        exit()
+# 文件锁
+@contextmanager
+def file_lock(lock_path: Path, timeout=30):
+    """
+    以独占创建锁文件的方式加锁 多个进程可以安全地修改同一目录中的文件
+    Args:
+        lock_path (Path): 锁文件路径
+        timeout (float): 超过该秒数的锁视为残留并删除
+    """
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_path.stat().st_mtime > timeout:
+                    lock_path.unlink()
+            except OSError:
+                pass
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        # 锁被视为残留删除后可能已被其他进程重新创建 只删除自己的锁文件
+        inode = os.fstat(fd).st_ino
+        os.close(fd)
+        try:
+            if lock_path.stat().st_ino == inode:
+                lock_path.unlink()
+        except FileNotFoundError:
+            pass
 
-    # 读取课程名称
-    calendar_name = get_course_name(soup)
-    if soup == None or soup == -1:
-        logging.error("文件读取失败")
-        exit()
 
-    # 从soup中解析课程表格
-    table = parse_soup_to_table(soup)
-    if table == []:
-        logging.error("解析课程表失败")
-        exit()
+# 打开日历文件索引
+@contextmanager
+def open_calendar_index(current_dir: Path):
+    """
+    加锁打开日历文件索引 退出时保存 批量转换的多个进程可以安全地写入同一目录
+    Args:
+        current_dir (Path): 输出目录
+    Yields:
+        CalendarIndex: 日历文件索引
+    """
+    with file_lock(current_dir / (CALENDAR_INDEX_NAME + '.lock')):
+        index = CalendarIndex.load(current_dir)
+        yield index
+        index.save()
 
-    # 将课程表格解析为课程列表
-    course_dict_list = table_to_list(table)
-    if course_dict_list == []:
-        logging.error("解析课程表格失败")
-        exit()
-    for course_dict in course_dict_list:
-        print(course_dict)
 
-    # 初始化日历
-    cal = init_calendar(calendar_name)
-    # 将课程列表写入日历
-    for course_dict in course_dict_list:
-        # 课程字典
-        date_time_list = calculate_course_start_time(course_start_date,
-                                                     course_dict)
-        add_course_event(cal, course_dict, date_time_list)
+# 写入时计算SHA-256
+class HashingWriter:
 
-    # 添加周事件
-    for week in range(1, 21):
-        add_week_event(cal, week, course_start_date)
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
 
-    # 写入日历文件
-    str = cal.to_ical()
-    name = write_calendar_file(str, calendar_name)
-    print(f"日历文件已保存到 {name}")
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.stream.write(data)
 
 
-if __name__ == "__main__":
-    # 输入文件路径
-    file_path = input("请输入文件路径:")
-    file_path = Path(file_path)
-    if not file_path.exists():
-        logging.error("文件不存在")
-        exit()
-    # 设置学期开始日期 课表第一周的星期一
-    course_start_date = input("请输入学期开始日期(格式:2024-02-24):")
+# 写入字符串到日历文件
+def write_calendar_file(str, calendar_name, output_dir=None):
     try:
-        course_start_date = datetime.datetime.strptime(course_start_date,
+        current_dir = get_output_dir(output_dir)
+        with open_calendar_index(current_dir) as index:
+            file_path = write_indexed_calendar(index, str, calendar_name)
+    except Exception as e:
+        # 记录后重新抛出 由调用者处理原始异常
+        logging.error("写入日历文件失败: %s", e)
+        raise
+    return file_path
+
+
+# 通过已打开的索引写入日历文件
+def write_indexed_calendar(index: CalendarIndex, ical: bytes,
+                           calendar_name) -> Path:
+    """
+    写入日历文件并登记到索引 已有内容相同的文件时直接返回该文件
+    一次打开索引写入多个日历时 不必每个文件都重新加锁和保存索引
+    Args:
+        index (CalendarIndex): 已加锁打开的索引
+        ical (bytes): ICS内容
+        calendar_name (str): 日历名称
+    Returns:
+        Path: 日历文件路径
+    """
+    digest = hashlib.sha256(ical).hexdigest()
+    # 如果已有内容相同的文件则跳过
+    file_path = index.lookup(digest, len(ical))
+    if file_path is not None:
+        return file_path
+    # 写入日历文件
+    file_path = index.next_path(calendar_name)
+    with open(file_path, 'wb') as f:
+        f.write(ical)
+    index.add(digest, len(ical), file_path)
+    return file_path
+
+
+# 流式写入日历文件
+def write_calendar_file_stream(calendar_name, course_list, course_start_date,
+                               output_dir=None, week_count=20, rrule=False,
+                               profile=None, dtstamp=None) -> Path:
+    """
+    流式写入日历文件 先写入临时文件并计算SHA-256 再通过索引去重
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        output_dir (str): 输出目录 默认为脚本所在目录
+        week_count (int): 周事件数量
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        profile (ScheduleProfile): 作息时间配置
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Returns:
+        Path: 日历文件路径
+    """
+    current_dir = get_output_dir(output_dir)
+    with tempfile.NamedTemporaryFile(dir=current_dir, suffix='.tmp',
+                                     delete=False) as f:
+        temp_path = Path(f.name)
+        writer = HashingWriter(f)
+        write_calendar_stream(writer, calendar_name, course_list,
+                              course_start_date, week_count, rrule, profile,
+                              dtstamp)
+    digest = writer.digest.hexdigest()
+    try:
+        with open_calendar_index(current_dir) as index:
+            file_path = index.lookup(digest, writer.size)
+            if file_path is not None:
+                temp_path.unlink()
+                return file_path
+            file_path = index.next_path(calendar_name)
+            temp_path.replace(file_path)
+            index.add(digest, writer.size, file_path)
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return file_path
+
+
+# 转换流程的性能记录
+class StageProfiler:
+    """
+    记录转换流程每个阶段的墙钟时间 CPU时间 内存峰值(tracemalloc)和调用次数
+    以及单元格 课程 上课次数和事件的数量 阶段之间不嵌套
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = {}
+        self.counts = Counter()
+
+    @contextmanager
+    def run(self, cprofile_path=None):
+        """
+        包住一次完整的转换 开启内存跟踪 指定路径时同时用cProfile记录并写入该文件
+        """
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        profiler = cProfile.Profile() if cprofile_path else None
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield self
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(cprofile_path)
+            if started:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record = self.stages.setdefault(
+                name, {'wall': 0.0, 'cpu': 0.0, 'peak_bytes': 0, 'calls': 0})
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            record['calls'] += 1
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                record['peak_bytes'] = max(record['peak_bytes'], peak)
+
+    def count(self, name: str, value: int):
+        self.counts[name] += value
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: {'stages': {阶段: {wall, cpu, peak_bytes, calls}}, 'counts': {...}}
+        """
+        return {'stages': {name: dict(record)
+                           for name, record in self.stages.items()},
+                'counts': dict(self.counts)}
+
+
+# 记录阶段耗时
+def profile_stage(profiler, name: str):
+    """
+    profiler为None时返回空的上下文 不记录任何数据
+    """
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+
+# 汇总多次转换的性能记录
+def merge_profile_reports(reports: list) -> dict:
+    """
+    汇总多个StageProfiler.report 时间和数量相加 内存峰值取最大值
+    Args:
+        reports (list): 性能记录列表
+    Returns:
+        dict: 汇总的性能记录 额外包含文件数量runs
+    """
+    merged = StageProfiler()
+    for report in reports:
+        for name, record in report['stages'].items():
+            total = merged.stages.setdefault(
+                name, {'wall': 0.0, 'cpu': 0.0, 'peak_bytes': 0, 'calls': 0})
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['calls'] += record['calls']
+            total['peak_bytes'] = max(total['peak_bytes'],
+                                      record['peak_bytes'])
+        merged.counts.update(report['counts'])
+    result = merged.report()
+    result['runs'] = len(reports)
+    return result
+
+
+# 输出性能记录
+def log_profile_report(report: dict):
+    for name, record in report['stages'].items():
+        logging.info(f"{name:>12}: {record['wall'] * 1000:9.2f} ms "
+                     f"CPU {record['cpu'] * 1000:9.2f} ms "
+                     f"内存峰值 {record['peak_bytes'] / 1024:9.1f} KB "
+                     f"{record['calls']} 次")
+    logging.info(', '.join(f"{name} {value}"
+                           for name, value in report['counts'].items()))
+
+
+# 转换选项
+@dataclass(frozen=True)
+class ConvertOptions:
+    """
+    转换选项
+    Attributes:
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        stream (bool): 是否跳过icalendar直接流式写入文件
+        schedule (ScheduleProfile): 作息时间配置 默认为 DEFAULT_SCHEDULE_PROFILE
+        tolerant (bool): 是否跳过无法解析的单元格 而不是整个文件失败
+        shard_size (int): 课程数量超过该值时分片并行生成事件 0为不分片
+        dtstamp (datetime.datetime): 所有事件的DTSTAMP 为None时不写入
+    """
+    engine: str = 'full'
+    rrule: bool = False
+    stream: bool = False
+    schedule: ScheduleProfile = None
+    tolerant: bool = False
+    shard_size: int = 0
+    dtstamp: datetime.datetime = None
+
+
+# 根据课程列表生成日历
+def build_calendar(calendar_name, course_list, course_start_date,
+                   week_count=20, rrule=False, profile=None,
+                   progress=None, profiler=None, dtstamp=None) -> Calendar:
+    """
+    根据课程列表生成日历
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        profile (ScheduleProfile): 作息时间配置
+        progress (callable): 每写入一门课程后调用 progress(已完成数量, 课程总数)
+        profiler (StageProfiler): 性能记录 为None时不记录
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Returns:
+        Calendar: 日历对象
+    """
+    # 初始化日历
+    cal = init_calendar(calendar_name)
+    add_event = add_course_rrule_event if rrule else add_course_event
+    # 将课程列表写入日历
+    with profile_stage(profiler, 'occurrences'):
+        occurrence_list = calculate_term_occurrences(course_start_date,
+                                                     course_list, profile)
+    with profile_stage(profiler, 'events'):
+        # UID的重复计数在整个日历范围内累计
+        repeats = Counter()
+        for done, (course, occurrences) in enumerate(
+                zip(course_list, occurrence_list), 1):
+            add_event(cal, course, [start for start, _ in occurrences],
+                      [end for _, end in occurrences], dtstamp=dtstamp,
+                      repeats=repeats)
+            if progress is not None:
+                progress(done, len(course_list))
+        # 添加周事件
+        for week in range(1, week_count + 1):
+            add_week_event(cal, week, course_start_date, dtstamp)
+    if profiler is not None:
+        profiler.count('occurrences', sum(map(len, occurrence_list)))
+        profiler.count('events', len(cal.subcomponents))
+    return cal
+
+
+# 生成一个分片的事件
+def _render_event_shard(course_list, course_start_date, rrule=False,
+                        profile=None, dtstamp=None, repeats=None) -> bytes:
+    cal = Calendar()
+    add_event = add_course_rrule_event if rrule else add_course_event
+    if repeats is None:
+        repeats = Counter()
+    occurrence_list = calculate_term_occurrences(course_start_date,
+                                                 course_list, profile)
+    for course, occurrences in zip(course_list, occurrence_list):
+        add_event(cal, course, [start for start, _ in occurrences],
+                  [end for _, end in occurrences], dtstamp=dtstamp,
+                  repeats=repeats)
+    return b''.join(event.to_ical() for event in cal.subcomponents)
+
+
+# 分片并行生成日历
+def render_calendar_sharded(calendar_name, course_list, course_start_date,
+                            week_count=20, rrule=False, profile=None,
+                            shard_size=500, executor=None,
+                            dtstamp=None) -> bytes:
+    """
+    将课程列表按顺序分为每shard_size门课程一片 在进程池中分别生成并序列化事件
+    再按原顺序拼接在同一个日历头尾之间 内容与 build_calendar(...).to_ical() 逐字节相同
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        rrule (bool): 是否将每门课程合并为重复规则事件
+        profile (ScheduleProfile): 作息时间配置
+        shard_size (int): 每片的课程数量
+        executor (Executor): 进程池 为None时临时创建
+        dtstamp (datetime.datetime): 事件时间戳 为None时不写入
+    Returns:
+        bytes: ICS内容
+    """
+    # 日历头和周事件在主进程中生成 课程事件插入在周事件之前
+    cal = init_calendar(calendar_name)
+    for week in range(1, week_count + 1):
+        add_week_event(cal, week, course_start_date, dtstamp)
+    ical = cal.to_ical()
+    if week_count:
+        insert_at = ical.index(b'BEGIN:VEVENT')
+    else:
+        insert_at = ical.rindex(b'END:VCALENDAR')
+    shards = [course_list[i:i + shard_size]
+              for i in range(0, len(course_list), shard_size)]
+    # 每片从前面各片累计的UID重复计数开始 只传入本片用到的键
+    offsets = []
+    total = Counter()
+    for shard in shards:
+        keys = Counter(course_repeat_key(course, week)
+                       for course in shard for week in course.week)
+        offsets.append(Counter({key: total[key] for key in keys
+                                if total[key]}))
+        total.update(keys)
+    args = ([course_start_date] * len(shards), [rrule] * len(shards),
+            [profile] * len(shards), [dtstamp] * len(shards), offsets)
+    if executor is None:
+        with ProcessPoolExecutor() as pool:
+            events = list(pool.map(_render_event_shard, shards, *args))
+    else:
+        events = list(executor.map(_render_event_shard, shards, *args))
+    return ical[:insert_at] + b''.join(events) + ical[insert_at:]
+
+
+# 解析课程表内容
+def parse_course_html(html: bytes, engine='full', profiler=None,
+                      diagnostics=None) -> tuple[str, list]:
+    """
+    解析课程表内容 得到日历名称和课程列表
+    Args:
+        html (bytes): 课程表文件内容
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        profiler (StageProfiler): 性能记录 为None时不记录
+        diagnostics (list): 传入列表时容错解析 见 table_to_list
+    Returns:
+        tuple: (日历名称, 课程记录列表)
+    Raises:
+        ValueError: 解析失败
+    """
+    if engine not in PARSER_ENGINES:
+        raise ValueError(f"未知的解析引擎: {engine}")
+    with profile_stage(profiler, 'parse'):
+        export = parse_soup(build_soup(html, engine))
+    if export is None:
+        raise ValueError("文件中不存在课程表")
+    with profile_stage(profiler, 'courses'):
+        course_list = table_to_list(export.table, diagnostics=diagnostics)
+    if course_list == []:
+        raise ValueError("解析课程表格失败")
+    if profiler is not None:
+        profiler.count('cells', sum(map(len, export.rows)))
+        profiler.count('courses', len(course_list))
+    return export.calendar_name, course_list
+
+
+# 转换单个文件
+def convert_file(file_path, course_start_date: datetime.datetime,
+                 output_dir=None, options=None, cache=None,
+                 profiler=None, diagnostics=None) -> Path:
+    """
+    将单个课程表文件转换为ICS文件 不进行交互
+    Args:
+        file_path (str): 课程表文件路径
+        course_start_date (datetime.datetime): 学期开始日期
+        output_dir (str): 输出目录 默认为脚本所在目录
+        options (ConvertOptions): 转换选项
+        cache (ResultCache): 转换结果缓存 为None时不使用缓存
+        profiler (StageProfiler): 性能记录 为None时不记录
+        diagnostics (list): 容错模式下记录无法解析的单元格 命中缓存时不记录
+    Returns:
+        Path: 日历文件路径
+    Raises:
+        ValueError: 文件读取或解析失败
+    """
+    if options is None:
+        options = ConvertOptions()
+    if not options.tolerant:
+        diagnostics = None
+    elif diagnostics is None:
+        diagnostics = []
+    key = result = None
+    # 解析完成后立即释放文件内容 生成事件时只保留课程列表
+    try:
+        with open_export(file_path, options.engine, profiler) as html:
+            if cache is not None:
+                key = cache.key(html, course_start_date, options)
+                result = cache.get(key)
+            if result is None:
+                calendar_name, course_list = parse_course_html(
+                    html, options.engine, profiler, diagnostics)
+    except OSError as e:
+        raise ValueError(f"文件读取失败: {e}") from e
+    if result is not None:
+        calendar_name, ical = result
+    elif options.stream and cache is None:
+        with profile_stage(profiler, 'write'):
+            return write_calendar_file_stream(calendar_name, course_list,
+                                              course_start_date, output_dir,
+                                              rrule=options.rrule,
+                                              profile=options.schedule,
+                                              dtstamp=options.dtstamp)
+    else:
+        ical = render_calendar(calendar_name, course_list, course_start_date,
+                               options, profiler)
+        if cache is not None:
+            cache.put(key, calendar_name, ical)
+    with profile_stage(profiler, 'write'):
+        return write_calendar_file(ical, calendar_name, output_dir)
+
+
+# 生成ICS内容
+def render_calendar(calendar_name, course_list, course_start_date,
+                    options=None, profiler=None, executor=None) -> bytes:
+    """
+    按转换选项生成ICS内容
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        options (ConvertOptions): 转换选项
+        profiler (StageProfiler): 性能记录 为None时不记录
+        executor (Executor): 分片生成事件的进程池 为None时不分片
+    Returns:
+        bytes: ICS内容
+    """
+    if options is None:
+        options = ConvertOptions()
+    if (executor is not None and not options.stream
+            and 0 < options.shard_size < len(course_list)):
+        with profile_stage(profiler, 'serialize'):
+            return render_calendar_sharded(
+                calendar_name, course_list, course_start_date,
+                rrule=options.rrule, profile=options.schedule,
+                shard_size=options.shard_size, executor=executor,
+                dtstamp=options.dtstamp)
+    if options.stream:
+        buffer = io.BytesIO()
+        with profile_stage(profiler, 'serialize'):
+            write_calendar_stream(buffer, calendar_name, course_list,
+                                  course_start_date, rrule=options.rrule,
+                                  profile=options.schedule,
+                                  dtstamp=options.dtstamp)
+        return buffer.getvalue()
+    cal = build_calendar(calendar_name, course_list, course_start_date,
+                         rrule=options.rrule, profile=options.schedule,
+                         profiler=profiler, dtstamp=options.dtstamp)
+    with profile_stage(profiler, 'serialize'):
+        return cal.to_ical()
+
+
+# 转换内存中的课程表
+def convert_bytes(html: bytes, course_start_date: datetime.datetime,
+                  options=None, profiler=None,
+                  diagnostics=None) -> tuple[str, bytes]:
+    """
+    将内存中的课程表内容转换为ICS内容 不读写文件
+    Args:
+        html (bytes): 课程表文件内容
+        course_start_date (datetime.datetime): 学期开始日期
+        options (ConvertOptions): 转换选项
+        profiler (StageProfiler): 性能记录 为None时不记录
+        diagnostics (list): 容错模式下记录无法解析的单元格
+    Returns:
+        tuple: (日历名称, ICS内容)
+    Raises:
+        ValueError: 解析失败
+    """
+    if options is None:
+        options = ConvertOptions()
+    if not options.tolerant:
+        diagnostics = None
+    elif diagnostics is None:
+        diagnostics = []
+    calendar_name, course_list = parse_course_html(html, options.engine,
+                                                   profiler, diagnostics)
+    return calendar_name, render_calendar(calendar_name, course_list,
+                                          course_start_date, options,
+                                          profiler)
+
+
+# 后台任务被取消
+class TaskCancelled(Exception):
+    pass
+
+
+# 后台任务的进度和取消状态
+class TaskContext:
+    """
+    在工作线程中运行的任务通过它报告进度和检查取消
+    界面线程调用drain取出进度 调用cancel请求取消
+    """
+
+    def __init__(self):
+        self._cancel_event = threading.Event()
+        self._progress = queue.Queue()
+
+    def report(self, fraction: float, message: str):
+        # 报告进度前检查取消 任务在下一个阶段开始前退出
+        self.check()
+        self._progress.put((fraction, message))
+
+    def finish(self, message: str):
+        # 任务已完成 不再响应取消
+        self._progress.put((1.0, message))
+
+    def check(self):
+        if self._cancel_event.is_set():
+            raise TaskCancelled()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def drain(self) -> list:
+        """
+        Returns:
+            list: 上次调用以来的 (进度, 说明) 列表
+        """
+        items = []
+        while True:
+            try:
+                items.append(self._progress.get_nowait())
+            except queue.Empty:
+                return items
+
+
+# 读取课程表任务
+def load_course_file_task(context: TaskContext, file_path,
+                          engine='full') -> tuple[str, list]:
+    """
+    在工作线程中读取并解析课程表文件
+    Args:
+        context (TaskContext): 任务上下文
+        file_path (str): 课程表文件路径
+        engine (str): 解析引擎
+    Returns:
+        tuple: (课程表名称, 课程记录列表)
+    Raises:
+        ValueError: 文件读取或解析失败
+        TaskCancelled: 任务被取消
+    """
+    context.report(0.0, "正在读取文件")
+    try:
+        with open(file_path, 'rb') as f:
+            html = f.read()
+    except OSError as e:
+        raise ValueError(f"读取文件失败: {e}") from e
+    context.report(0.2, "正在解析课程表")
+    export = parse_soup(build_soup(html, engine))
+    if export is None:
+        raise ValueError("文件中不存在课程表")
+    context.report(0.7, "正在解析课程")
+    course_list = table_to_list(export.table)
+    if course_list == []:
+        raise ValueError("解析课程表格失败")
+    context.finish("读取完成")
+    return export.calendar_name, course_list
+
+
+# 导出日历任务
+def export_calendar_task(context: TaskContext, calendar_name, course_list,
+                         course_start_date, week_count=20,
+                         save_path=None) -> bytes:
+    """
+    在工作线程中生成日历 指定保存路径时写入文件
+    先写入临时文件再替换 取消或失败时不会留下不完整的文件
+    Args:
+        context (TaskContext): 任务上下文
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        save_path (str): 保存路径
+    Returns:
+        bytes: ICS内容
+    Raises:
+        TaskCancelled: 任务被取消
+    """
+    context.report(0.0, "正在生成日历")
+    cal = build_calendar(
+        calendar_name, course_list, course_start_date, week_count,
+        progress=lambda done, total: context.report(
+            done / total * 0.8, f"正在生成日历 {done}/{total}"))
+    context.report(0.8, "正在序列化日历")
+    ical = cal.to_ical()
+    if save_path is not None:
+        context.report(0.9, "正在保存文件")
+        save_path = Path(save_path)
+        temp_path = save_path.with_name(save_path.name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(ical)
+        os.replace(temp_path, save_path)
+    context.finish("导出完成")
+    return ical
+
+
+# 默认的转换结果缓存目录
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / '.class2ics_cache'
+
+
+# 转换结果缓存
+class ResultCache:
+    """
+    磁盘上的转换结果缓存 以(课程表SHA-256, 学期开始日期, 作息时间配置, 输出选项)为键
+    命中时直接返回ICS内容 不再解析和生成日历 总大小超过上限时删除最久未使用的条目
+    解析引擎和流式写入不影响输出内容 不参与计算键
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=256 << 20):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def key(self, html: bytes, course_start_date: datetime.datetime,
+            options=None) -> str:
+        if options is None:
+            options = ConvertOptions()
+        # 作息时间配置的repr包含全部规则
+        schedule = repr(options.schedule or DEFAULT_SCHEDULE_PROFILE)
+        parts = [
+            hashlib.sha256(html).hexdigest(),
+            course_start_date.strftime('%Y-%m-%d'),
+            hashlib.sha256(schedule.encode('utf-8')).hexdigest(),
+            f'rrule={int(options.rrule)}',
+        ]
+        # 容错解析可能跳过部分单元格 与正常解析的结果分开缓存
+        if options.tolerant:
+            parts.append('tolerant=1')
+        if options.dtstamp is not None:
+            parts.append(
+                f'dtstamp={utc_dtstamp(options.dtstamp):%Y%m%dT%H%M%SZ}')
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}.bin'
+
+    def _lock(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return file_lock(self.cache_dir / '.lock')
+
+    def _record(self, field: str):
+        # 命中统计保存在缓存目录中 多个进程共享
+        stats_path = self.cache_dir / 'stats.json'
+        with self._lock():
+            try:
+                with open(stats_path, encoding='utf-8') as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {'hits': 0, 'misses': 0}
+            stats[field] = stats.get(field, 0) + 1
+            temp_path = stats_path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(temp_path, stats_path)
+
+    def get(self, key: str) -> tuple:
+        """
+        Returns:
+            tuple: (日历名称, ICS内容) 未命中时返回None
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                data = f.read()
+            # 更新修改时间 用于LRU淘汰
+            os.utime(entry_path)
+        except OSError:
+            self._record('misses')
+            return None
+        self._record('hits')
+        name_size = int.from_bytes(data[:4], 'big')
+        return data[4:4 + name_size].decode('utf-8'), data[4 + name_size:]
+
+    def put(self, key: str, calendar_name: str, ical: bytes):
+        name = calendar_name.encode('utf-8')
+        with self._lock():
+            temp_path = self._entry_path(key).with_suffix('.tmp')
+            with open(temp_path, 'wb') as f:
+                f.write(len(name).to_bytes(4, 'big') + name + ical)
+            os.replace(temp_path, self._entry_path(key))
+            self._evict()
+
+    def _evict(self):
+        entries = [(entry.stat(), entry)
+                   for entry in self.cache_dir.glob('*.bin')]
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in sorted(entries, key=lambda item: item[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: 命中次数 未命中次数 条目数量和总大小
+        """
+        try:
+            with open(self.cache_dir / 'stats.json', encoding='utf-8') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {'hits': 0, 'misses': 0}
+        sizes = [entry.stat().st_size
+                 for entry in self.cache_dir.glob('*.bin')]
+        stats['entries'] = len(sizes)
+        stats['bytes'] = sum(sizes)
+        return stats
+
+
+# 批量转换的子进程任务
+def _batch_worker(file_path, course_start_date, output_dir, options,
+                  cache, profile=False, cprofile_dir=None) -> dict:
+    profiler = StageProfiler() if profile or cprofile_dir else None
+    cprofile_path = None
+    if cprofile_dir is not None:
+        cprofile_path = Path(cprofile_dir) / (Path(file_path).stem + '.prof')
+    diagnostics = []
+    try:
+        with (profiler.run(cprofile_path) if profiler else nullcontext()):
+            output = convert_file(file_path, course_start_date, output_dir,
+                                  options, cache, profiler, diagnostics)
+        result = {'file': str(file_path), 'status': 'ok',
+                  'output': str(output), 'error': ''}
+    except Exception as e:
+        result = {'file': str(file_path), 'status': 'error',
+                  'output': '', 'error': f"{type(e).__name__}: {e}"}
+    result['warnings'] = len(diagnostics)
+    result['diagnostics'] = diagnostics
+    if profiler is not None:
+        result['profile'] = profiler.report()
+    return result
+
+
+# 收集批量转换的输入文件
+def collect_input_files(pattern: str) -> list:
+    """
+    收集批量转换的输入文件
+    Args:
+        pattern (str): 目录或glob表达式 目录时匹配其中的*.xls和*.html文件
+    Returns:
+        list: 文件路径列表
+    """
+    path = Path(pattern)
+    if path.is_dir():
+        files = [f for f in path.iterdir()
+                 if f.suffix.lower() in ('.xls', '.html', '.htm')]
+    else:
+        files = [Path(f) for f in glob.glob(pattern, recursive=True)]
+    return sorted(f for f in files if f.is_file())
+
+
+# 批量转换
+def batch_convert(pattern: str, course_start_date: datetime.datetime,
+                  output_dir=None, workers=None, summary_path=None,
+                  options=None, cache=None, profile_path=None,
+                  cprofile_dir=None, diagnostics_path=None) -> list:
+    """
+    批量转换目录或glob匹配的所有课程表文件
+    单个文件失败不会中断其余文件的转换
+    Args:
+        pattern (str): 目录或glob表达式
+        course_start_date (datetime.datetime): 学期开始日期
+        output_dir (str): 输出目录 默认为脚本所在目录
+        workers (int): 进程池大小 默认为CPU核数
+        summary_path (str): 汇总CSV文件路径 为None时不写入
+        options (ConvertOptions): 转换选项
+        cache (ResultCache): 转换结果缓存 为None时不使用缓存
+        profile_path (str): 性能记录JSON文件路径 为None时不记录
+        cprofile_dir (str): 每个文件的cProfile结果目录 为None时不记录
+        diagnostics_path (str): 容错模式下无法解析的单元格的CSV文件路径
+    Returns:
+        list: 每个文件的转换结果字典列表
+    """
+    files = collect_input_files(pattern)
+    if not files:
+        logging.error("没有找到课程表文件")
+        return []
+    results = []
+    # 输出目录在多个进程间共享 先创建好
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if cprofile_dir is not None:
+        Path(cprofile_dir).mkdir(parents=True, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_batch_worker, f, course_start_date, output_dir,
+                            options, cache, profile_path is not None,
+                            cprofile_dir) for f in files
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['status'] == 'ok':
+                logging.info(f"{result['file']} -> {result['output']}")
+                if result['warnings']:
+                    logging.warning(f"{result['file']} 跳过 "
+                                    f"{result['warnings']} 个无法解析的单元格")
+            else:
+                logging.error(f"{result['file']} 转换失败: {result['error']}")
+            results.append(result)
+    results.sort(key=lambda r: r['file'])
+    if summary_path is not None:
+        with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(
+                f, fieldnames=['file', 'status', 'output', 'error',
+                               'warnings'],
+                extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+    if diagnostics_path is not None:
+        with open(diagnostics_path, 'w', newline='',
+                  encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(('file', ) + ParseDiagnostic._fields)
+            for result in results:
+                for diagnostic in result['diagnostics']:
+                    writer.writerow((result['file'], ) + diagnostic)
+    ok_count = sum(1 for r in results if r['status'] == 'ok')
+    logging.info(f"批量转换完成: 成功 {ok_count} 个, 失败 {len(results) - ok_count} 个")
+    if cache is not None:
+        stats = cache.stats()
+        logging.info(f"缓存命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+                     f"{stats['entries']} 个条目共 {stats['bytes']} 字节")
+    if profile_path is not None:
+        report = merge_profile_reports(
+            [r['profile'] for r in results if 'profile' in r])
+        report['files'] = {r['file']: r['profile']
+                           for r in results if 'profile' in r}
+        with open(profile_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        log_profile_report(report)
+    return results
+
+
+# 合并日历的分组字段
+MERGE_KEYS = ('location', 'teacher', 'name')
+# 文件名中不能使用的字符
+UNSAFE_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+# 按字段建立课程索引
+def index_courses(course_list, keys=MERGE_KEYS) -> dict:
+    """
+    遍历一次课程列表 按每个字段的值分组
+    多个课程表中完全相同的课程(如合班课)只保留一次
+    Args:
+        course_list (list): 课程记录列表
+        keys (tuple): 分组字段 见 MERGE_KEYS
+    Returns:
+        dict: {字段: {字段值: 课程记录列表}} 字段值为空的课程不分组
+    """
+    indexes = {key: {} for key in keys}
+    for course in dict.fromkeys(course_list):
+        for key, index in indexes.items():
+            value = getattr(course, key)
+            if value:
+                index.setdefault(value, []).append(course)
+    return indexes
+
+
+# 解析课程表的子进程任务
+def _parse_worker(file_path, engine, tolerant=False) -> tuple:
+    diagnostics = [] if tolerant else None
+    try:
+        with open_export(file_path, engine) as html:
+            calendar_name, courses = parse_course_html(
+                html, engine, diagnostics=diagnostics)
+        return (str(file_path), calendar_name, courses, '',
+                len(diagnostics or ()))
+    except Exception as e:
+        return str(file_path), '', [], f"{type(e).__name__}: {e}", 0
+
+
+# 逐个解析多个课程表
+def iter_parsed_files(files, engine='full', workers=None, tolerant=False):
+    """
+    在进程池中解析多个课程表 按文件顺序逐个返回结果
+    同时提交的任务数量有上限 已解析但未取走的结果不会无限堆积
+    解析失败的文件记录日志后跳过
+    Args:
+        files (list): 文件路径列表
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        workers (int): 进程池大小 默认为CPU核数
+        tolerant (bool): 是否跳过无法解析的单元格
+    Yields:
+        tuple: (文件路径, 日历名称, 课程记录列表)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = []
+        files = iter(files)
+        while True:
+            for file_path in files:
+                pending.append(executor.submit(_parse_worker, file_path,
+                                               engine, tolerant))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                return
+            # 按文件顺序返回 输出与进程调度无关
+            file_path, calendar_name, courses, error, warnings = \
+                pending.pop(0).result()
+            if error:
+                logging.error(f"{file_path} 解析失败: {error}")
+                continue
+            if warnings:
+                logging.warning(f"{file_path} 跳过 {warnings} 个无法解析的单元格")
+            yield file_path, calendar_name, courses
+
+
+# 解析多个课程表
+def parse_course_files(files, engine='full', workers=None,
+                       tolerant=False) -> list:
+    """
+    在进程池中解析多个课程表 按文件顺序合并课程
+    Args:
+        files (list): 文件路径列表
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        workers (int): 进程池大小 默认为CPU核数
+        tolerant (bool): 是否跳过无法解析的单元格
+    Returns:
+        list: 所有文件的课程记录列表
+    """
+    course_list = []
+    for _, _, courses in iter_parsed_files(files, engine, workers, tolerant):
+        course_list.extend(courses)
+    return course_list
+
+
+# 教室或教师的时间冲突
+class Conflict(NamedTuple):
+    """
+    同一教室或教师在同一周和星期有多门上课时间重叠的不同课程
+    Attributes:
+        kind (str): 冲突字段 location 或 teacher
+        value (str): 教室或教师名称
+        week (int): 周数
+        weekday (int): 星期 1-7
+        period (int): 最早的开始节数
+        courses (tuple): 冲突的课程记录
+        start (datetime.datetime): 重叠课程中最早的开始时间
+        end (datetime.datetime): 重叠课程中最晚的结束时间
+    """
+    kind: str
+    value: str
+    week: int
+    weekday: int
+    period: int
+    courses: tuple
+    start: datetime.datetime = None
+    end: datetime.datetime = None
+
+
+# 检查冲突的字段
+CONFLICT_KEYS = ('location', 'teacher')
+CONFLICT_LABELS = {'location': '教室', 'teacher': '教师'}
+
+
+# 检查教室和教师的时间冲突
+def find_conflicts(course_list, course_start_date: datetime.datetime,
+                   keys=CONFLICT_KEYS, profile=None) -> list[Conflict]:
+    """
+    以 (字段, 字段值, 周数, 星期) 为键建立哈希索引 每门课程每周登记一次上课时间段
+    同一键下按开始时间排序 时间段相互重叠且名称 教师或教室不同的课程即为冲突
+    每次课跨越多个节次 不同开始节次的课程也可能冲突
+    多个课程表中完全相同的课程(如合班课)不算冲突
+    Args:
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        keys (tuple): 检查的字段 见 CONFLICT_KEYS
+        profile (ScheduleProfile): 作息时间配置
+    Returns:
+        list: 按字段 字段值和时间排序的冲突列表
+    """
+    courses = list(dict.fromkeys(course_list))
+    occurrence_list = calculate_term_occurrences(course_start_date, courses,
+                                                 profile)
+    buckets = {}
+    for course, occurrences in zip(courses, occurrence_list):
+        identity = (course.name, course.teacher, course.location)
+        for key in keys:
+            value = getattr(course, key)
+            if not value:
+                continue
+            for week, (start, end) in zip(course.week, occurrences):
+                buckets.setdefault(
+                    (key, value, week, course.weekday), []).append(
+                        (start, end, course.period, identity, course))
+    conflicts = []
+
+    def add_conflict(bucket, group):
+        overlapping = {}
+        for _, _, _, identity, course in group:
+            overlapping.setdefault(identity, course)
+        if len(overlapping) > 1:
+            conflicts.append(Conflict(
+                *bucket, min(entry[2] for entry in group),
+                tuple(overlapping.values()), group[0][0],
+                max(entry[1] for entry in group)))
+
+    for bucket, entries in buckets.items():
+        if len(entries) < 2:
+            continue
+        entries.sort(key=lambda entry: entry[:3])
+        # 相互重叠的时间段合并为一组
+        group = [entries[0]]
+        group_end = entries[0][1]
+        for entry in entries[1:]:
+            if entry[0] < group_end:
+                group.append(entry)
+                group_end = max(group_end, entry[1])
+            else:
+                add_conflict(bucket, group)
+                group = [entry]
+                group_end = entry[1]
+        add_conflict(bucket, group)
+    conflicts.sort(key=lambda c: c[:5])
+    return conflicts
+
+
+# 写入冲突报告
+def write_conflict_report(conflicts, report_path):
+    """
+    写入冲突报告 文件后缀为.json时写入JSON 否则写入CSV
+    Args:
+        conflicts (list): 冲突列表
+        report_path (str): 报告文件路径
+    """
+    if Path(report_path).suffix.lower() == '.json':
+        records = [{
+            'kind': c.kind, 'value': c.value, 'week': c.week,
+            'weekday': c.weekday, 'period': c.period,
+            'start': c.start.isoformat(), 'end': c.end.isoformat(),
+            'courses': [{'name': course.name, 'teacher': course.teacher,
+                         'location': course.location}
+                        for course in c.courses]
+        } for c in conflicts]
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        return
+    with open(report_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'value', 'week', 'weekday', 'period',
+                         'start', 'end', 'courses'])
+        for c in conflicts:
+            writer.writerow([
+                c.kind, c.value, c.week, c.weekday, c.period,
+                c.start.isoformat(), c.end.isoformat(),
+                '; '.join(f'{course.name}({course.teacher},{course.location})'
+                          for course in c.courses)
+            ])
+
+
+# 添加冲突事件
+def add_conflict_event(cal, conflict: Conflict, course_start_date,
+                       profile=None, dtstamp=None):
+    if profile is None:
+        profile = DEFAULT_SCHEDULE_PROFILE
+    if conflict.start is not None:
+        start, end = conflict.start, conflict.end
+    else:
+        course_date = (course_start_date + datetime.timedelta(
+            weeks=conflict.week - 1, days=conflict.weekday - 1)).date()
+        start, end = profile.slot(course_date, conflict.period)
+    # 创建事件对象
+    event = Event()
+    # 设置事件的名称
+    event.add('summary',
+              f'冲突: {CONFLICT_LABELS[conflict.kind]} {conflict.value}')
+    event.add('dtstart', start)
+    event.add('dtend', end)
+    # 同一教室或教师在同一时间只有一个冲突事件
+    identity = '\x1f'.join(map(str, (conflict.kind, conflict.value,
+                                     conflict.week, conflict.weekday,
+                                     conflict.period)))
+    event.add('uid', 'conflict-' + hashlib.sha1(
+        identity.encode('utf-8')).hexdigest() + '@class2ics')
+    if dtstamp is not None:
+        event.add('dtstamp', utc_dtstamp(dtstamp))
+    # 描述中列出冲突的课程
+    event.add('description', '\n'.join(
+        f'{course.name} {course.teacher} {course.location}'
+        for course in conflict.courses))
+    event.add('categories', ['冲突'])
+    cal.add_component(event)
+
+
+# 分析多个课程表的冲突
+def analyze_conflicts(pattern: str, report_path,
+                      course_start_date: datetime.datetime, engine='full',
+                      workers=None, tolerant=False,
+                      profile=None) -> list[Conflict]:
+    """
+    解析目录或glob匹配的所有课程表 检查教室和教师的时间冲突并写入报告
+    Args:
+        pattern (str): 目录或glob表达式
+        report_path (str): 报告文件路径 .json 或 .csv
+        course_start_date (datetime.datetime): 学期开始日期
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        workers (int): 进程池大小 默认为CPU核数
+        tolerant (bool): 是否跳过无法解析的单元格
+        profile (ScheduleProfile): 作息时间配置
+    Returns:
+        list: 冲突列表
+    """
+    files = collect_input_files(pattern)
+    if not files:
+        logging.error("没有找到课程表文件")
+        return []
+    conflicts = find_conflicts(
+        parse_course_files(files, engine, workers, tolerant),
+        course_start_date, profile=profile)
+    write_conflict_report(conflicts, report_path)
+    logging.info(f"发现 {len(conflicts)} 处冲突 报告已保存到 {report_path}")
+    return conflicts
+
+
+# 合并日历时每次加锁写入的日历总大小
+MERGE_WRITE_BATCH_BYTES = 64 << 20
+
+
+# 合并多个课程表并按教室 教师 课程生成日历
+def merge_convert(pattern: str, course_start_date: datetime.datetime,
+                  keys=MERGE_KEYS, output_dir=None, workers=None,
+                  summary_path=None, options=None, conflicts_path=None,
+                  flag_conflicts=False) -> dict:
+    """
+    在进程池中解析所有课程表 每个文件只解析一次
+    再按字段建立索引 每个字段值生成一个日历 写入 输出目录/字段/字段值_V0.ics
+    日历在不持有索引锁时生成 每批 MERGE_WRITE_BATCH_BYTES 加锁写入一次 总耗时与课程数量成线性关系
+    Args:
+        pattern (str): 目录或glob表达式
+        course_start_date (datetime.datetime): 学期开始日期
+        keys (tuple): 分组字段 见 MERGE_KEYS
+        output_dir (str): 输出目录 默认为脚本所在目录
+        workers (int): 进程池大小 默认为CPU核数
+        summary_path (str): 汇总CSV文件路径 为None时不写入
+        options (ConvertOptions): 转换选项
+        conflicts_path (str): 冲突报告路径 为None时不写入
+        flag_conflicts (bool): 是否在教室和教师日历中添加冲突事件
+    Returns:
+        dict: {字段: {字段值: 日历文件路径}}
+    """
+    if options is None:
+        options = ConvertOptions()
+    for key in keys:
+        if key not in MERGE_KEYS:
+            raise ValueError(f"未知的分组字段: {key}")
+    files = collect_input_files(pattern)
+    if not files:
+        logging.error("没有找到课程表文件")
+        return {}
+    course_list = parse_course_files(files, options.engine, workers,
+                                     options.tolerant)
+    flagged = {}
+    if conflicts_path is not None or flag_conflicts:
+        conflicts = find_conflicts(course_list, course_start_date,
+                                   profile=options.schedule)
+        if conflicts_path is not None:
+            write_conflict_report(conflicts, conflicts_path)
+        logging.info(f"发现 {len(conflicts)} 处冲突")
+        if flag_conflicts:
+            for conflict in conflicts:
+                flagged.setdefault((conflict.kind, conflict.value),
+                                   []).append(conflict)
+    indexes = index_courses(course_list, keys)
+    outputs = {}
+    rows = []
+    # 课程较多的日历分片并行生成
+    executor = None
+    if options.shard_size:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for key, index in indexes.items():
+            current_dir = get_output_dir(
+                Path(get_output_dir(output_dir)) / key)
+            outputs[key] = {}
+            # 生成日历时不持有索引锁 攒够一批后加锁写入
+            # 持有锁超过file_lock的超时会被其他进程视为残留锁删除
+            batch = []
+            batch_size = 0
+            for done, (value, courses) in enumerate(index.items(), 1):
+                conflicts = flagged.get((key, value))
+                if conflicts:
+                    # 冲突事件需要添加到日历对象中 不使用流式写入
+                    cal = build_calendar(value, courses, course_start_date,
+                                         rrule=options.rrule,
+                                         profile=options.schedule,
+                                         dtstamp=options.dtstamp)
+                    for conflict in conflicts:
+                        add_conflict_event(cal, conflict, course_start_date,
+                                           options.schedule, options.dtstamp)
+                    ical = cal.to_ical()
+                else:
+                    ical = render_calendar(value, courses, course_start_date,
+                                           options, executor=executor)
+                batch.append((value, len(courses), ical))
+                batch_size += len(ical)
+                if batch_size < MERGE_WRITE_BATCH_BYTES and done < len(index):
+                    continue
+                with open_calendar_index(current_dir) as calendar_index:
+                    for value, count, ical in batch:
+                        file_path = write_indexed_calendar(
+                            calendar_index, ical,
+                            UNSAFE_FILENAME_PATTERN.sub('_', value))
+                        outputs[key][value] = file_path
+                        rows.append({'key': key, 'value': value,
+                                     'courses': count,
+                                     'output': str(file_path)})
+                batch = []
+                batch_size = 0
+            logging.info(f"按 {key} 生成 {len(index)} 个日历 -> {current_dir}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if summary_path is not None:
+        with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(
+                f, fieldnames=['key', 'value', 'courses', 'output'])
+            writer.writeheader()
+            writer.writerows(rows)
+    logging.info(f"合并 {len(files)} 个文件的 {len(course_list)} 门课程")
+    return outputs
+
+
+# 课程记录导出的字段
+# occurrence: 每次上课一行 包含计算出的开始和结束时间
+# course: 每门课程每个上课时段一行 周数为列表
+RECORD_FIELDS = {
+    'occurrence': ('calendar', 'name', 'teacher', 'location', 'week',
+                   'weekday', 'period', 'start', 'end'),
+    'course': ('calendar', 'name', 'teacher', 'location', 'weeks', 'weekday',
+               'period'),
+}
+RECORD_FORMATS = ('jsonl', 'csv')
+
+
+# 生成课程记录
+def iter_course_records(calendar_name, course_list, course_start_date,
+                        level='occurrence', profile=None):
+    """
+    逐条生成规范化的课程记录 周数 星期和节次为整数 时间为ISO格式
+    Args:
+        calendar_name (str): 日历名称
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        level (str): 记录粒度 见 RECORD_FIELDS
+        profile (ScheduleProfile): 作息时间配置
+    Yields:
+        tuple: 按 RECORD_FIELDS[level] 顺序的字段值
+    """
+    if level == 'course':
+        for course in course_list:
+            yield (calendar_name, course.name, course.teacher,
+                   course.location, list(course.week), course.weekday,
+                   course.period)
+        return
+    occurrence_list = calculate_term_occurrences(course_start_date,
+                                                 course_list, profile)
+    for course, occurrences in zip(course_list, occurrence_list):
+        for week, (start, end) in zip(course.week, occurrences):
+            yield (calendar_name, course.name, course.teacher,
+                   course.location, week, course.weekday, course.period,
+                   start.isoformat(), end.isoformat())
+
+
+# 课程记录写入器
+class CourseRecordWriter:
+    """
+    以JSON Lines或CSV格式分块写入课程记录 每chunk_size条写入一次
+    多次调用write时CSV表头只写入一次
+    """
+
+    def __init__(self, stream, fmt='jsonl', level='occurrence',
+                 chunk_size=1000):
+        if fmt not in RECORD_FORMATS:
+            raise ValueError(f"未知的导出格式: {fmt}")
+        if level not in RECORD_FIELDS:
+            raise ValueError(f"未知的记录粒度: {level}")
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = RECORD_FIELDS[level]
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._buffer = io.StringIO()
+        self._csv = csv.writer(self._buffer)
+        if fmt == 'csv':
+            self._csv.writerow(self.fields)
+
+    def _format(self, record):
+        if self.fmt == 'csv':
+            # CSV中的周数列表以空格分隔
+            self._csv.writerow(' '.join(map(str, value))
+                               if isinstance(value, list) else value
+                               for value in record)
+        else:
+            self._buffer.write(json.dumps(dict(zip(self.fields, record)),
+                                          ensure_ascii=False))
+            self._buffer.write('\n')
+
+    def write(self, records):
+        pending = 0
+        for record in records:
+            self._format(record)
+            self.count += 1
+            pending += 1
+            if pending >= self.chunk_size:
+                self.flush()
+                pending = 0
+        self.flush()
+
+    def flush(self):
+        self.stream.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+
+# 导出多个课程表的课程记录
+def export_course_records(pattern: str, course_start_date: datetime.datetime,
+                          output_path, fmt=None, level='occurrence',
+                          engine='full', workers=None, tolerant=False,
+                          profile=None) -> int:
+    """
+    在进程池中解析目录或glob匹配的所有课程表 按文件顺序逐个写入课程记录
+    任何时候只保留少量文件的课程 不需要把整个院系的课程放在内存中
+    Args:
+        pattern (str): 目录或glob表达式
+        course_start_date (datetime.datetime): 学期开始日期
+        output_path (str): 输出文件路径
+        fmt (str): 导出格式 见 RECORD_FORMATS 默认按文件后缀判断
+        level (str): 记录粒度 见 RECORD_FIELDS
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        workers (int): 进程池大小 默认为CPU核数
+        tolerant (bool): 是否跳过无法解析的单元格
+        profile (ScheduleProfile): 作息时间配置
+    Returns:
+        int: 写入的记录数量
+    """
+    if fmt is None:
+        fmt = 'csv' if Path(output_path).suffix.lower() == '.csv' else 'jsonl'
+    files = collect_input_files(pattern)
+    if not files:
+        logging.error("没有找到课程表文件")
+        return 0
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = CourseRecordWriter(f, fmt, level)
+        for _, calendar_name, courses in iter_parsed_files(
+                files, engine, workers, tolerant):
+            writer.write(iter_course_records(calendar_name, courses,
+                                             course_start_date, level,
+                                             profile))
+    logging.info(f"导出 {writer.count} 条课程记录 -> {output_path}")
+    return writer.count
+
+
+# 生成日历中所有事件的内容行
+def calendar_event_records(course_list, course_start_date, week_count=20,
+                           profile=None) -> dict:
+    """
+    生成日历中所有事件的内容行 以UID为键
+    Args:
+        course_list (list): 课程记录列表
+        course_start_date (datetime.datetime): 学期开始日期
+        week_count (int): 周事件数量
+        profile (ScheduleProfile): 作息时间配置
+    Returns:
+        dict: UID -> 不含BEGIN和END的内容行列表
+    """
+    records = {}
+    occurrence_list = calculate_term_occurrences(course_start_date,
+                                                 course_list, profile)
+    repeats = Counter()
+    for course, occurrences in zip(course_list, occurrence_list):
+        uids = course_event_uids(course, [start for start, _ in occurrences],
+                                 repeats)
+        for (date_time, end_time), uid in zip(occurrences, uids):
+            records[uid] = course_event_lines(
+                course, date_time, end_time=end_time)[1:-1]
+    for week in range(1, week_count + 1):
+        records[week_event_uid(week, course_start_date)] = week_event_lines(
+            week, course_start_date)[1:-1]
+    return records
+
+
+# 读取增量转换状态
+def load_incremental_state(state_path) -> dict:
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'cells': {}, 'events': {}}
+
+
+# 保存增量转换状态
+def save_incremental_state(state_path, state: dict):
+    state_path = Path(state_path)
+    temp_path = state_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(temp_path, state_path)
+
+
+# 增量转换
+def incremental_convert(file_path, course_start_date: datetime.datetime,
+                        state_path, output_dir=None, engine='full',
+                        week_count=20, profile=None, dtstamp=None) -> dict:
+    """
+    增量转换 只解析内容变化的单元格 只输出变化的事件
+    状态文件缓存上次每个单元格(按内容哈希)的解析结果 以及每个事件的内容哈希和序号
+    新增事件序号为0 修改的事件序号加1 删除的事件以STATUS:CANCELLED输出并且序号加1
+    Args:
+        file_path (str): 课程表文件路径
+        course_start_date (datetime.datetime): 学期开始日期
+        state_path (str): 状态文件路径 不存在时视为首次转换
+        output_dir (str): 输出目录 默认为脚本所在目录
+        engine (str): 解析引擎 见 PARSER_ENGINES
+        week_count (int): 周事件数量
+        profile (ScheduleProfile): 作息时间配置
+        dtstamp (datetime.datetime): 事件时间戳 默认为当前时间
+    Returns:
+        dict: 新增 修改 删除 复用的单元格数量以及增量日历文件路径
+    Raises:
+        ValueError: 文件读取失败
+    """
+    export = read_course_export(file_path, engine)
+    if export is None:
+        raise ValueError("文件读取失败")
+    state = load_incremental_state(state_path)
+    old_cells = state['cells']
+    cells = {}
+    reused = 0
+
+    # 内容未变化的单元格直接使用上次的解析结果
+    def parse_cell(cell: str) -> list:
+        nonlocal reused
+        key = hashlib.sha1(cell.encode('utf-8')).hexdigest()
+        if key in old_cells:
+            reused += 1
+            course_dicts = old_cells[key]
+        elif key in cells:
+            course_dicts = cells[key]
+        else:
+            course_dicts = [
+                dict(course_dict, week=list(course_dict['week']))
+                for course_dict in parse_course_str_to_list(cell)
+            ]
+        cells[key] = course_dicts
+        return [
+            dict(course_dict, week=tuple(course_dict['week']))
+            for course_dict in course_dicts
+        ]
+
+    course_list = table_to_list(export.table, parse_cell)
+    records = calendar_event_records(course_list, course_start_date,
+                                     week_count, profile)
+
+    old_events = state['events']
+    events = {}
+    if dtstamp is None:
+        dtstamp = datetime.datetime.now(datetime.timezone.utc)
+    lines = [
+        'BEGIN:VCALENDAR', 'VERSION:2.0',
+        f'X-WR-CALNAME:{escape_text(export.calendar_name)}',
+        'X-WR-TIMEZONE:Asia/Shanghai'
+    ]
+    counts = {'added': 0, 'changed': 0, 'cancelled': 0, 'reused_cells': 0}
+
+    def add_event(uid, record, sequence, status=None):
+        lines.append('BEGIN:VEVENT')
+        # 属性顺序与icalendar输出相同
+        lines.extend(record[:3])
+        lines.extend(event_identity_lines(uid, dtstamp))
+        lines.append(f'SEQUENCE:{sequence}')
+        lines.extend(record[3:])
+        if status is not None:
+            lines.append(f'STATUS:{status}')
+        lines.append('END:VEVENT')
+
+    for uid, record in records.items():
+        digest = hashlib.sha1('\n'.join(record).encode('utf-8')).hexdigest()
+        old = old_events.get(uid)
+        if old is None:
+            sequence = 0
+            counts['added'] += 1
+            add_event(uid, record, sequence)
+        elif old['hash'] != digest or old.get('cancelled'):
+            sequence = old['sequence'] + 1
+            counts['changed'] += 1
+            add_event(uid, record, sequence)
+        else:
+            sequence = old['sequence']
+        events[uid] = {'hash': digest, 'sequence': sequence,
+                       'record': record}
+    for uid, old in old_events.items():
+        if uid in events:
+            continue
+        if old.get('cancelled'):
+            events[uid] = old
+            continue
+        sequence = old['sequence'] + 1
+        counts['cancelled'] += 1
+        add_event(uid, old['record'], sequence, 'CANCELLED')
+        events[uid] = dict(old, sequence=sequence, cancelled=True)
+    lines.append('END:VCALENDAR')
+    counts['reused_cells'] = reused
+
+    if counts['added'] or counts['changed'] or counts['cancelled']:
+        ical = b''.join(fold_line(line) for line in lines)
+        counts['output'] = write_calendar_file(
+            ical, f"{export.calendar_name}_增量", output_dir)
+    else:
+        counts['output'] = None
+    save_incremental_state(state_path, {'cells': cells, 'events': events})
+    return counts
+
+
+# 主函数
+def main(course_start_date: datetime.datetime, file_path: str,
+         output_dir=None, cache=None):
+
+    # 使用缓存时直接返回之前的转换结果
+    if cache is not None:
+        with open(file_path, 'rb') as f:
+            key = cache.key(f.read(), course_start_date)
+        result = cache.get(key)
+        if result is not None:
+            name = write_calendar_file(result[1], result[0], output_dir)
+            print(f"使用缓存 日历文件已保存到 {name}")
+            return
+
+    # 读取html文件 一次解析出课程名称和课程表格
+    export = read_course_export(file_path)
+    if export is None:
+        logging.error("文件读取失败")
+        exit()
+    calendar_name = export.calendar_name
+
+    # 将课程表格解析为课程列表
+    course_list = table_to_list(export.table)
+    if course_list == []:
+        logging.error("解析课程表格失败")
+        exit()
+    for course in course_list:
+        print(course)
+
+    # 生成日历
+    cal = build_calendar(calendar_name, course_list, course_start_date)
+
+    # 写入日历文件
+    str = cal.to_ical()
+    name = write_calendar_file(str, calendar_name, output_dir)
+    if cache is not None:
+        cache.put(key, calendar_name, str)
+    print(f"日历文件已保存到 {name}")
+
+
+# 解析命令行参数
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="课程表转ICS工具")
+    parser.add_argument('--batch', metavar='PATH',
+                        help="批量转换 目录或glob表达式 如 'exports/*.xls'")
+    parser.add_argument('--start', metavar='DATE',
+                        help="学期开始日期(格式:2024-02-24)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="进程池大小 默认为CPU核数")
+    parser.add_argument('--output-dir', default=None,
+                        help="输出目录 默认为脚本所在目录")
+    parser.add_argument('--summary', default=None,
+                        help="批量转换汇总CSV文件路径")
+    parser.add_argument('--engine', choices=PARSER_ENGINES, default='full',
+                        help="解析引擎 fast只解析标题和课程表 mmap只解码课程表所在的字节范围")
+    parser.add_argument('--rrule', action='store_true',
+                        help="每门课程合并为一个重复规则事件")
+    parser.add_argument('--stream', action='store_true',
+                        help="跳过icalendar直接流式写入日历文件")
+    parser.add_argument('--schedule', metavar='PATH', default=None,
+                        help="作息时间配置文件(JSON)")
+    parser.add_argument('--campus', default=None,
+                        help="使用配置文件中的哪个校区 只有一个时可以省略")
+    parser.add_argument('--cache', metavar='DIR', nargs='?', default=None,
+                        const=str(DEFAULT_CACHE_DIR),
+                        help="使用转换结果缓存 可指定缓存目录")
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help="缓存大小上限(MB)")
+    parser.add_argument('--merge', metavar='KEYS', default=None,
+                        help="批量转换时合并所有课程表 按逗号分隔的字段"
+                        "(location,teacher,name)分别生成日历")
+    parser.add_argument('--conflicts', metavar='PATH', default=None,
+                        help="批量转换时检查教室和教师的时间冲突 写入CSV或JSON报告"
+                        " 不与--merge同时使用时只检查冲突")
+    parser.add_argument('--flag-conflicts', action='store_true',
+                        help="合并日历时在教室和教师日历中添加冲突事件")
+    parser.add_argument('--tolerant', action='store_true',
+                        help="跳过无法解析的单元格 其余课程照常转换")
+    parser.add_argument('--diagnostics', metavar='PATH', default=None,
+                        help="容错模式下将无法解析的单元格写入CSV文件")
+    parser.add_argument('--records', metavar='PATH', default=None,
+                        help="批量导出课程记录而不生成日历 .csv为CSV 其余为JSON Lines")
+    parser.add_argument('--records-level', choices=tuple(RECORD_FIELDS),
+                        default='occurrence',
+                        help="occurrence每次上课一行 course每门课程一行")
+    parser.add_argument('--shard-size', type=int, default=0,
+                        help="合并日历时 课程数量超过该值的日历分片并行生成事件")
+    parser.add_argument('--dtstamp', metavar='DATETIME', default=None,
+                        help="所有事件使用固定的DTSTAMP(格式:2024-02-24T00:00:00 "
+                             "未指定时区时为UTC) 重复转换的输出逐字节相同")
+    parser.add_argument('--profile', metavar='PATH', default=None,
+                        help="批量转换时记录每个阶段的耗时和内存 写入JSON文件")
+    parser.add_argument('--cprofile', metavar='DIR', default=None,
+                        help="批量转换时为每个文件写入cProfile结果")
+    parser.add_argument('--incremental', metavar='PATH',
+                        help="增量转换 只输出与上次相比变化的事件")
+    parser.add_argument('--state', default=None,
+                        help="增量转换的状态文件路径")
+    return parser.parse_args(argv)
+
+
+# 交互式运行
+def interactive(output_dir=None, cache=None):
+    # 输入文件路径
+    file_path = input("请输入文件路径:")
+    file_path = Path(file_path)
+    if not file_path.exists():
+        logging.error("文件不存在")
+        exit()
+    # 设置学期开始日期 课表第一周的星期一
+    course_start_date = input("请输入学期开始日期(格式:2024-02-24):")
+    try:
+        course_start_date = datetime.datetime.strptime(course_start_date,
                                                        "%Y-%m-%d")
     except Exception as e:
-        logging.error("日期格式错误", e)
+        logging.error("日期格式错误: %s", e)
         exit()
 
     if file_path == None or file_path == "":
         print("没有选择文件")
         exit()
     # 运行主函数
-    main(course_start_date, file_path)
+    main(course_start_date, file_path, output_dir, cache)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache, args.cache_size << 20)
+    if args.batch is None and args.incremental is None:
+        interactive(args.output_dir, cache)
+        exit()
+    if args.start is None:
+        logging.error("批量转换和增量转换需要指定 --start 学期开始日期")
+        exit(1)
+    try:
+        start_date = datetime.datetime.strptime(args.start, "%Y-%m-%d")
+    except ValueError:
+        logging.error("日期格式错误")
+        exit(1)
+    dtstamp = None
+    if args.dtstamp is not None:
+        try:
+            dtstamp = utc_dtstamp(
+                datetime.datetime.fromisoformat(args.dtstamp))
+        except ValueError:
+            logging.error("DTSTAMP格式错误")
+            exit(1)
+    profile = None
+    if args.schedule is not None:
+        profiles = load_schedule_profiles(args.schedule)
+        if args.campus is None and len(profiles) == 1:
+            profile = next(iter(profiles.values()))
+        elif args.campus in profiles:
+            profile = profiles[args.campus]
+        else:
+            logging.error(f"请使用 --campus 指定校区: {', '.join(profiles)}")
+            exit(1)
+    if args.incremental is not None:
+        if args.state is None:
+            logging.error("增量转换需要指定 --state 状态文件路径")
+            exit(1)
+        result = incremental_convert(args.incremental, start_date, args.state,
+                                     args.output_dir, args.engine,
+                                     profile=profile, dtstamp=dtstamp)
+        print(f"新增 {result['added']} 个, 修改 {result['changed']} 个, "
+              f"删除 {result['cancelled']} 个事件, "
+              f"复用 {result['reused_cells']} 个单元格")
+        if result['output'] is not None:
+            print(f"增量日历文件已保存到 {result['output']}")
+    else:
+        options = ConvertOptions(engine=args.engine, rrule=args.rrule,
+                                 stream=args.stream, schedule=profile,
+                                 tolerant=args.tolerant,
+                                 shard_size=args.shard_size,
+                                 dtstamp=dtstamp)
+        if args.merge is not None:
+            keys = tuple(key.strip() for key in args.merge.split(','))
+            if not merge_convert(args.batch, start_date, keys,
+                                 args.output_dir, args.workers, args.summary,
+                                 options, args.conflicts,
+                                 args.flag_conflicts):
+                exit(1)
+            exit()
+        if args.records is not None:
+            if not export_course_records(args.batch, start_date,
+                                         args.records,
+                                         level=args.records_level,
+                                         engine=args.engine,
+                                         workers=args.workers,
+                                         tolerant=args.tolerant,
+                                         profile=profile):
+                exit(1)
+            exit()
+        if args.conflicts is not None:
+            analyze_conflicts(args.batch, args.conflicts, start_date,
+                              args.engine, args.workers, args.tolerant,
+                              profile)
+            exit()
+        results = batch_convert(args.batch, start_date, args.output_dir,
+                                args.workers, args.summary, options, cache,
+                                args.profile, args.cprofile,
+                                args.diagnostics)
+        if not results or any(r['status'] != 'ok' for r in results):
+            exit(1)
@@ -0,0 +1,940 @@
+import io
+import os
+import re
+import json
+import time
+import random
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from collections import Counter
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import Class2ICS
+
+
+# 计时
+def time_it(func, repeat: int) -> float:
+    """
+    重复执行函数并返回最短耗时
+    Args:
+        func (callable): 无参数函数
+        repeat (int): 重复次数
+    Returns:
+        float: 最短耗时(秒)
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# 重构前的周数解析 用于校验和对比
+def legacy_parse_week(week_str: str) -> list:
+    week_list = []
+    for week in week_str.split(' '):
+        if '单' in week or '双' in week:
+            week = week.replace('单', '').replace('双', '')
+            if '-' in week:
+                week = week.split('-')
+                for i in range(int(week[0]), int(week[1]) + 1, 2):
+                    week_list.append(i)
+            else:
+                week_list.append(int(week))
+        elif '-' in week:
+            week = week.split('-')
+            for i in range(int(week[0]), int(week[1]) + 1):
+                week_list.append(i)
+        else:
+            week_list.append(int(week))
+    return sorted(week_list)
+
+
+# 周数表达式样例
+WEEK_SAMPLES = [
+    '1', '16', '1-16', '1-8', '9-16', '单1-15', '双2-16', '单1-9', '双2-4 7',
+    '1-11', '1-6 8-12', '1 3-4 6-12', '3 5 7 9', '单3-11 14-16', '双2-4',
+    '单1', '双2', '2-2', '1-4 6-12', '10 1-3', '单1-17 双2-18', '5-5 5',
+]
+
+
+# 比较周数解析
+def bench_week(repeat: int = 10, loops: int = 10000) -> dict:
+    """
+    校验 parse_week 与重构前的实现结果一致 并比较两者的耗时
+    Args:
+        repeat (int): 重复次数
+        loops (int): 每次重复解析全部样例的轮数
+    Returns:
+        dict: 实现名称到耗时的字典
+    """
+    for week_str in WEEK_SAMPLES:
+        expected = legacy_parse_week(week_str)
+        actual = Class2ICS.parse_week(week_str)
+        if list(actual) != expected:
+            raise AssertionError(f"{week_str}: {actual} != {expected}")
+    for week_str in ['', '1-', '单', 'a', '1,2', '1  2']:
+        try:
+            Class2ICS.parse_week(week_str)
+        except ValueError:
+            continue
+        raise AssertionError(f"{week_str!r} 应当解析失败")
+    implementations = {
+        'legacy': legacy_parse_week,
+        'cached': Class2ICS.parse_week,
+    }
+    results = {}
+    for name, func in implementations.items():
+
+        def run():
+            for _ in range(loops):
+                for week_str in WEEK_SAMPLES:
+                    func(week_str)
+
+        results[name] = time_it(run, repeat)
+        print(f"{name:>6}: {results[name] * 1000:.2f} ms")
+    return results
+
+
+# 重构前的课程字符串解析 用于校验和对比
+def legacy_parse_course_str(course_str: str) -> list:
+    course_list = []
+    course_str = re.sub(r"\(B.*?\)", "", course_str)
+    parts = re.split(r'[()]', course_str)
+    parts = [part for part in parts if part.strip()]
+    course_dict = {}
+    for i, part in enumerate(parts):
+        if (i % 3 == 0):
+            course_dict['name'] = part.strip()
+        elif (i % 3 == 1):
+            course_dict['teacher'] = part.strip()
+        elif (i % 3 == 2):
+            parts = re.split(r'[,]', part)
+            course_dict['week'] = legacy_parse_week(parts[0].strip())
+            course_dict['location'] = parts[1].strip()
+            course_list.append(course_dict)
+            course_dict = {}
+    return course_list
+
+
+# 课程字符串样例
+CELL_SAMPLES = [
+    '高等数学(张三)(1-16,教101)',
+    '大学英语(李四)(单1-15,外语楼202)线性代数(王五)(双2-16,教303)',
+    '程序设计(B12345)(赵六)(1-4 6-12,机房1)',
+    '体育(钱七)(双2-4 7,操场)',
+    '形势与政策(孙八)(3,报告厅)',
+    '物理实验(周九)(1-8,实验楼,301)',
+    ' 化学 ( 吴十 ) ( 1-8 , 化学楼 ) ',
+]
+# 只有新的解析方式支持的样例及其结果
+CELL_EXTRA_SAMPLES = {
+    '高等数学（张三）（1-16，教101）':
+        [('高等数学', '张三', (*range(1, 17), ), '教101')],
+    '高等数学(上)(张三)(1-16,教101)':
+        [('高等数学(上)', '张三', (*range(1, 17), ), '教101')],
+    '程序设计(Python)(B00001)(赵六)(2,机房1)数据库(钱七)(3,机房2)':
+        [('程序设计(Python)', '赵六', (2, ), '机房1'),
+         ('数据库', '钱七', (3, ), '机房2')],
+    '高数(张三(外聘))(1-16,教101)':
+        [('高数', '张三(外聘)', (*range(1, 17), ), '教101')],
+    '高数(张三)(1-16,教学楼(东)101)':
+        [('高数', '张三', (*range(1, 17), ), '教学楼(东)101')],
+    '高数(Bob)(1-16,教101)':
+        [('高数', 'Bob', (*range(1, 17), ), '教101')],
+    '高数(张三)(1-16,教(1)楼)线代(李四)(1-8,教102)':
+        [('高数', '张三', (*range(1, 17), ), '教(1)楼'),
+         ('线代', '李四', (*range(1, 9), ), '教102')],
+}
+
+
+# 比较课程字符串解析
+def bench_cell(repeat: int = 10, loops: int = 200) -> dict:
+    """
+    校验 parse_course_str_to_list 与重构前的实现结果一致 并比较耗时
+    样例包括固定样例和合成课程表中的所有单元格
+    Args:
+        repeat (int): 重复次数
+        loops (int): 每次重复解析全部样例的轮数
+    Returns:
+        dict: 实现名称到耗时的字典
+    """
+    export = Class2ICS.parse_soup(Class2ICS.build_soup(synthetic_export(
+        rows=11, fill=0.8, courses_per_cell=2, week_complexity=2)))
+    cells = CELL_SAMPLES + [cell for row in export.rows
+                            for cell in row[1:] if cell]
+    for cell in cells:
+        expected = [dict(course, week=tuple(course['week']))
+                    for course in legacy_parse_course_str(cell)]
+        actual = Class2ICS.parse_course_str_to_list(cell)
+        if actual != expected:
+            raise AssertionError(f"{cell}: {actual} != {expected}")
+    for cell, expected in CELL_EXTRA_SAMPLES.items():
+        actual = [tuple(course.values())
+                  for course in Class2ICS.parse_course_str_to_list(cell)]
+        if actual != expected:
+            raise AssertionError(f"{cell}: {actual} != {expected}")
+    for cell in ['高等数学(张三)(1-x,教101)', '体育(钱七)(3 操场)',
+                 '高数(张三)(1-16)线代(李四)(1-8,教102)',
+                 '高数(张三)(1-16教101)线代(李四)(1-8,教102)',
+                 '高数(张三)(1-16,教((1))楼)线代(李四)(1-8,教102)']:
+        try:
+            Class2ICS.parse_course_str_to_list(cell)
+        except ValueError:
+            continue
+        raise AssertionError(f"{cell!r} 应当解析失败")
+    uncached = Class2ICS.tokenize_course_cell.__wrapped__
+    implementations = {
+        'legacy': legacy_parse_course_str,
+        'tokenizer': uncached,
+        'cached': Class2ICS.parse_course_str_to_list,
+    }
+    results = {}
+    for name, func in implementations.items():
+
+        def run():
+            for _ in range(loops):
+                for cell in cells:
+                    func(cell)
+
+        results[name] = time_it(run, repeat)
+        print(f"{name:>9}: {results[name] * 1000:.2f} ms")
+    print(f"{len(cells)} 个单元格 解析结果一致")
+    return results
+
+
+# 重构前的上课时间计算 每次都重新构建作息时间表和映射
+def legacy_course_start_time(course_start_date, course) -> list:
+    summer_schedule = [[8, 0], [9, 0], [10, 10], [11, 10], [14, 30], [15, 30],
+                       [16, 40], [17, 40], [19, 30], [20, 30], [21, 30]]
+    winter_schedule = [[8, 0], [9, 0], [10, 10], [11, 10], [14, 00], [15, 00],
+                       [16, 10], [17, 10], [19, 00], [20, 00], [21, 00]]
+    start_time_list = []
+    for week in course.week:
+        course_date = course_start_date + datetime.timedelta(
+            weeks=week - 1, days=course.weekday - 1)
+        if course_date.month >= 5 and course_date.month < 10:
+            schedule = [datetime.time(h, m, 0) for h, m in summer_schedule]
+        else:
+            schedule = [datetime.time(h, m, 0) for h, m in winter_schedule]
+        start_time_list.append(
+            datetime.datetime.combine(course_date.date(),
+                                      schedule[course.period - 1]))
+    return start_time_list
+
+
+# 生成随机课程记录
+def synthetic_courses(count: int, seed: int = 0) -> list:
+    """
+    生成随机的课程记录 模拟整个院系的课程表
+    Args:
+        count (int): 课程数量
+        seed (int): 随机种子
+    Returns:
+        list: 课程记录列表
+    """
+    rng = random.Random(seed)
+    courses = []
+    for i in range(count):
+        week_str = rng.choice(WEEK_SAMPLES)
+        courses.append(
+            Class2ICS.Course(f'课程{i % 500}', f'教师{i % 300}', f'教室{i % 200}',
+                             Class2ICS.parse_week(week_str),
+                             rng.randint(1, 7), rng.choice((1, 3, 5, 7, 9))))
+    return courses
+
+
+# 比较上课时间计算
+def bench_occurrence(count: int = 20000, repeat: int = 3,
+                     course_start_date=datetime.datetime(2024, 2, 26)) -> dict:
+    """
+    校验批量计算的上课时间与逐门课程计算一致 并比较两者的耗时
+    Args:
+        count (int): 课程数量
+        repeat (int): 重复次数
+        course_start_date (datetime.datetime): 学期开始日期
+    Returns:
+        dict: 实现名称到耗时的字典
+    """
+    courses = synthetic_courses(count)
+    expected = [legacy_course_start_time(course_start_date, course)
+                for course in courses]
+    actual = Class2ICS.calculate_term_occurrences(course_start_date, courses)
+    if expected != [[start for start, _ in occurrences]
+                    for occurrences in actual]:
+        raise AssertionError("批量计算的上课时间不一致")
+    implementations = {
+        'legacy': lambda: [legacy_course_start_time(course_start_date, course)
+                           for course in courses],
+        'per-course': lambda: [
+            Class2ICS.calculate_course_start_time(course_start_date, course)
+            for course in courses
+        ],
+        'batched': lambda: Class2ICS.calculate_term_occurrences(
+            course_start_date, courses),
+    }
+    results = {}
+    for name, func in implementations.items():
+        results[name] = time_it(func, repeat)
+        print(f"{name:>10}: {results[name] * 1000:.2f} ms")
+    return results
+
+
+# 比较解析引擎
+def bench_parser(file_path: str, repeat: int = 10) -> dict:
+    """
+    比较不同解析引擎读取并解析课程表的耗时 并检查结果一致
+    Args:
+        file_path (str): 课程表文件路径
+        repeat (int): 重复次数
+    Returns:
+        dict: 解析引擎到耗时的字典
+    """
+    tables = {}
+    results = {}
+    for engine in Class2ICS.PARSER_ENGINES:
+
+        def run():
+            export = Class2ICS.read_course_export(file_path, engine)
+            tables[engine] = (export.calendar_name, export.table)
+
+        results[engine] = time_it(run, repeat)
+        print(f"{engine:>6}: {results[engine] * 1000:.2f} ms")
+    if len({repr(t) for t in tables.values()}) != 1:
+        raise AssertionError("解析引擎的结果不一致")
+    return results
+
+
+# 校验重复规则输出
+def verify_rrule(file_path: str, course_start_date: datetime.datetime) -> int:
+    """
+    分别以单次事件和重复规则事件生成日历 展开后比较上课时间是否完全一致
+    Args:
+        file_path (str): 课程表文件路径
+        course_start_date (datetime.datetime): 学期开始日期
+    Returns:
+        int: 上课次数
+    """
+    export = Class2ICS.read_course_export(file_path)
+    course_list = Class2ICS.table_to_list(export.table)
+    calendars = {}
+    for rrule in (False, True):
+        cal = Class2ICS.build_calendar(export.calendar_name, course_list,
+                                       course_start_date, rrule=rrule)
+        calendars[rrule] = cal.to_ical()
+    expected = Class2ICS.expand_calendar_events(calendars[False])
+    actual = Class2ICS.expand_calendar_events(calendars[True])
+    if expected != actual:
+        raise AssertionError(f"展开后不一致: 缺少 {expected - actual} "
+                             f"多出 {actual - expected}")
+    print(f"上课时间一致: {sum(expected.values())} 次, "
+          f"事件数 {calendars[False].count(b'BEGIN:VEVENT')} -> "
+          f"{calendars[True].count(b'BEGIN:VEVENT')}, "
+          f"文件大小 {len(calendars[False])} -> {len(calendars[True])} 字节")
+    return sum(expected.values())
+
+
+# 将日历拆分为头部 事件块和尾部
+def split_calendar(ical: bytes) -> tuple:
+    head, _, rest = ical.partition(b'BEGIN:VEVENT\r\n')
+    body, _, tail = rest.rpartition(b'END:VEVENT\r\n')
+    events = (b'BEGIN:VEVENT\r\n' + body).split(b'END:VEVENT\r\n')
+    return head, sorted(events), tail
+
+
+# 需要转义或折行的课程
+EDGE_CASE_COURSES = [
+    Class2ICS.Course('C++程序设计;实验,上机\\课', '张三,李四', '机房;1\n楼',
+                     (1, 2, 3), 1, 1),
+    Class2ICS.Course('马克思主义基本原理概论' * 5, 'Prof. ' + 'x' * 80,
+                     '教学楼' + 'A' * 70 + '\\B', (1, 3, 5, 9, 9), 3, 9),
+]
+
+
+# 校验时使用的固定DTSTAMP
+VERIFY_DTSTAMP = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+# 读取校验使用的课程
+def verify_courses(file_path: str = None) -> tuple:
+    """
+    读取课程表中的课程 未指定文件时使用合成课程表 两者都加上需要转义或折行的课程
+    Args:
+        file_path (str): 课程表文件路径 为None时使用 synthetic_export
+    Returns:
+        tuple: (日历名称, 课程记录列表)
+    """
+    if file_path is None:
+        calendar_name, course_list = Class2ICS.parse_course_html(
+            synthetic_export())
+    else:
+        export = Class2ICS.read_course_export(file_path)
+        calendar_name = export.calendar_name
+        course_list = Class2ICS.table_to_list(export.table)
+    return calendar_name, course_list + EDGE_CASE_COURSES
+
+
+# 校验流式写入
+def verify_writer(file_path: str, course_start_date: datetime.datetime,
+                  repeat: int = 3) -> dict:
+    """
+    比较icalendar和流式写入生成的日历 头尾逐字节相同 事件块忽略顺序后逐字节相同
+    分别校验不写入和写入固定DTSTAMP的情况
+    Args:
+        file_path (str): 课程表文件路径 为None时使用合成课程表
+        course_start_date (datetime.datetime): 学期开始日期
+        repeat (int): 计时重复次数
+    Returns:
+        dict: (写入方式, rrule, 是否写入DTSTAMP) 到耗时的字典
+    """
+    calendar_name, course_list = verify_courses(file_path)
+    results = {}
+    for rrule in (False, True):
+        for dtstamp in (None, VERIFY_DTSTAMP):
+            outputs = {}
+
+            def run_icalendar():
+                cal = Class2ICS.build_calendar(calendar_name, course_list,
+                                               course_start_date, rrule=rrule,
+                                               dtstamp=dtstamp)
+                outputs['icalendar'] = cal.to_ical()
+
+            def run_stream():
+                buffer = io.BytesIO()
+                Class2ICS.write_calendar_stream(buffer, calendar_name,
+                                                course_list, course_start_date,
+                                                rrule=rrule, dtstamp=dtstamp)
+                outputs['stream'] = buffer.getvalue()
+
+            stamped = dtstamp is not None
+            for name, func in (('icalendar', run_icalendar),
+                               ('stream', run_stream)):
+                key = (name, rrule, stamped)
+                results[key] = time_it(func, repeat)
+                print(f"{name:>9} rrule={rrule!s:<5} dtstamp={stamped!s:<5}: "
+                      f"{results[key] * 1000:.2f} ms")
+            if split_calendar(outputs['icalendar']) != split_calendar(
+                    outputs['stream']):
+                raise AssertionError(f"rrule={rrule} dtstamp={stamped} "
+                                     "时流式写入的内容不一致")
+    print("流式写入与icalendar输出一致")
+    return results
+
+
+# 合成课程表的节次和星期
+SYNTHETIC_PERIODS = list(Class2ICS.PERIOD_NUMBERS)
+SYNTHETIC_WEEKDAYS = list(Class2ICS.WEEKDAY_NUMBERS)
+
+
+# 生成随机周数表达式
+def synthetic_week_expression(rng: random.Random, complexity: int) -> str:
+    """
+    生成由complexity项组成的周数表达式 如 单1-9 12 14-16
+    Args:
+        rng (random.Random): 随机数生成器
+        complexity (int): 表达式的项数
+    Returns:
+        str: 周数表达式
+    """
+    tokens = []
+    for _ in range(complexity):
+        start = rng.randint(1, 16)
+        kind = rng.random()
+        if kind < 0.3:
+            tokens.append(str(start))
+        else:
+            end = rng.randint(start, 20)
+            prefix = '' if kind < 0.7 else rng.choice('单双')
+            tokens.append(f'{prefix}{start}-{end}')
+    return ' '.join(tokens)
+
+
+# 生成合成的课程表导出文件
+def synthetic_export(rows: int = 11, fill: float = 0.5,
+                     courses_per_cell: int = 1, week_complexity: int = 1,
+                     seed: int = 0, name: str = '合成课程表') -> bytes:
+    """
+    生成与教务系统导出格式相同的 manualArrangeCourseTable 课程表
+    Args:
+        rows (int): 节次行数 超过11行时重复节次名称
+        fill (float): 单元格中有课程的比例
+        courses_per_cell (int): 每个有课程的单元格中的课程数量
+        week_complexity (int): 周数表达式的项数
+        seed (int): 随机种子
+        name (str): 课程表名称
+    Returns:
+        bytes: 课程表文件内容
+    """
+    rng = random.Random(seed)
+    header = ''.join(f'<th>{day}</th>' for day in SYNTHETIC_WEEKDAYS)
+    body = []
+    for row in range(rows):
+        cells = []
+        for _ in SYNTHETIC_WEEKDAYS:
+            if rng.random() >= fill:
+                cells.append('<td></td>')
+                continue
+            courses = []
+            for _ in range(courses_per_cell):
+                index = rng.randrange(1000)
+                # 部分课程带有课程代码 解析时会被删除
+                code = f'(B{index:05d})' if rng.random() < 0.3 else ''
+                courses.append(
+                    f'课程{index}{code}(教师{rng.randrange(300)})'
+                    f'({synthetic_week_expression(rng, week_complexity)},'
+                    f'教室{rng.randrange(200)})')
+            cells.append(f'<td>{"".join(courses)}</td>')
+        period = SYNTHETIC_PERIODS[row % len(SYNTHETIC_PERIODS)]
+        body.append(f'<tr><td>{period}</td>{"".join(cells)}</tr>')
+    html = ('<html><head><meta charset="utf-8"></head><body>'
+            f'<h3 align="center">{name}</h3>'
+            '<table id="manualArrangeCourseTable">'
+            f'<tr><th>节次/周次</th>{header}</tr>{"".join(body)}'
+            '</table></body></html>')
+    return html.encode('utf-8')
+
+
+# 写入多个合成课程表
+def write_synthetic_exports(directory, files: int = 1, seed: int = 0,
+                            **params) -> list:
+    """
+    在目录中写入files个合成课程表 每个文件的随机种子不同
+    Args:
+        directory (str): 输出目录
+        files (int): 文件数量
+        seed (int): 第一个文件的随机种子
+        params: 传给 synthetic_export 的参数
+    Returns:
+        list: 文件路径列表
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = directory / f'synthetic_{i:04d}.xls'
+        path.write_bytes(synthetic_export(seed=seed + i,
+                                          name=f'合成课程表{i}', **params))
+        paths.append(path)
+    return paths
+
+
+# 当前代码的版本
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).resolve().parent, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+# 基准测试套件
+def bench_suite(files: int = 5, rows: int = 11, fill: float = 0.5,
+                courses_per_cell: int = 1, week_complexity: int = 1,
+                repeat: int = 5, seed: int = 0, start: str = '2024-02-26',
+                options=None, output_path=None, compare_path=None) -> dict:
+    """
+    生成合成课程表 逐个文件完整转换并记录每个阶段
+    (read 读取, parse 解析, courses 课程列表, occurrences 上课时间,
+    events 事件, serialize 序列化, write 写入) 的耗时
+    每个阶段取所有文件所有重复中的最小值和中位数 结果写入JSON便于比较
+    Args:
+        files (int): 文件数量
+        rows (int): 每个文件的节次行数
+        fill (float): 单元格中有课程的比例
+        courses_per_cell (int): 每个单元格中的课程数量
+        week_complexity (int): 周数表达式的项数
+        repeat (int): 每个文件的重复次数
+        seed (int): 随机种子
+        start (str): 学期开始日期
+        options (Class2ICS.ConvertOptions): 转换选项
+        output_path (str): 结果JSON文件路径 为None时不写入
+        compare_path (str): 之前的结果JSON文件 与本次结果比较
+    Returns:
+        dict: 测试结果
+    """
+    course_start_date = datetime.datetime.strptime(start, "%Y-%m-%d")
+    params = {'files': files, 'rows': rows, 'fill': fill,
+              'courses_per_cell': courses_per_cell,
+              'week_complexity': week_complexity, 'repeat': repeat,
+              'seed': seed, 'start': start}
+    samples = {}
+    totals = []
+    counts = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = write_synthetic_exports(
+            Path(temp_dir) / 'input', files, seed, rows=rows, fill=fill,
+            courses_per_cell=courses_per_cell,
+            week_complexity=week_complexity)
+        for i in range(repeat):
+            run_counts = Counter()
+            for path in paths:
+                # 每次写入新目录 避免输出索引去重跳过写入
+                output_dir = Path(temp_dir) / f'output_{i}_{path.stem}'
+                profiler = Class2ICS.StageProfiler(memory=False)
+                begin = time.perf_counter()
+                Class2ICS.convert_file(path, course_start_date, output_dir,
+                                       options, profiler=profiler)
+                totals.append(time.perf_counter() - begin)
+                for name, record in profiler.stages.items():
+                    samples.setdefault(name, []).append(record['wall'])
+                run_counts.update(profiler.counts)
+            counts = dict(run_counts)
+    stages = {
+        name: {'min_ms': min(values) * 1000,
+               'median_ms': statistics.median(values) * 1000}
+        for name, values in samples.items()
+    }
+    result = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.node(),
+        'params': params,
+        'counts': counts,
+        'stages': stages,
+        'total': {'min_ms': min(totals) * 1000,
+                  'median_ms': statistics.median(totals) * 1000},
+    }
+    previous = None
+    if compare_path is not None:
+        with open(compare_path, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('params') != params:
+            print("注意: 两次测试的参数不同")
+    print(f"{'阶段':>12} {'最小(ms)':>10} {'中位数(ms)':>10}")
+    for name, record in list(stages.items()) + [('total', result['total'])]:
+        line = (f"{name:>12} {record['min_ms']:10.3f} "
+                f"{record['median_ms']:10.3f}")
+        if previous is not None:
+            before = (previous['total'] if name == 'total' else
+                      previous['stages'].get(name))
+            if before and before['median_ms']:
+                ratio = record['median_ms'] / before['median_ms']
+                line += f"  {ratio:6.2f}x"
+        print(line)
+    print(', '.join(f"{name} {value}" for name, value in counts.items()))
+    if output_path is not None:
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {output_path}")
+    return result
+
+
+# 校验分片并行生成日历
+def verify_shard(file_path: str, course_start_date: datetime.datetime,
+                 count: int = 20000, shard_size: int = 500,
+                 workers: int = None) -> dict:
+    """
+    比较串行和分片并行生成的日历 两者必须逐字节相同
+    课程包括课程表中的课程和count门随机课程
+    Args:
+        file_path (str): 课程表文件路径
+        course_start_date (datetime.datetime): 学期开始日期
+        count (int): 随机课程数量
+        shard_size (int): 每片的课程数量
+        workers (int): 进程池大小 默认为CPU核数
+    Returns:
+        dict: (方式, rrule) 到耗时的字典
+    """
+    export = Class2ICS.read_course_export(file_path)
+    course_list = (Class2ICS.table_to_list(export.table) + EDGE_CASE_COURSES +
+                   synthetic_courses(count))
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 预先启动进程 不计入耗时
+        list(executor.map(int, range(executor._max_workers)))
+        for rrule in (False, True):
+            start = time.perf_counter()
+            serial = Class2ICS.build_calendar(
+                export.calendar_name, course_list, course_start_date,
+                rrule=rrule).to_ical()
+            results[('serial', rrule)] = time.perf_counter() - start
+            start = time.perf_counter()
+            sharded = Class2ICS.render_calendar_sharded(
+                export.calendar_name, course_list, course_start_date,
+                rrule=rrule, shard_size=shard_size, executor=executor)
+            results[('sharded', rrule)] = time.perf_counter() - start
+            if sharded != serial:
+                raise AssertionError(f"rrule={rrule} 时分片生成的日历不一致")
+            print(f"rrule={rrule!s:<5}: 串行 "
+                  f"{results[('serial', rrule)] * 1000:.0f} ms, 分片 "
+                  f"{results[('sharded', rrule)] * 1000:.0f} ms, "
+                  f"{len(serial)} 字节")
+    print("分片生成的日历与串行生成的逐字节一致")
+    return results
+
+
+# 以图形界面的方式轮询后台任务
+def poll_task(executor, context, task, *args, cancel_after=None) -> tuple:
+    """
+    在后台线程中运行任务 主线程像图形界面的root.after一样轮询进度
+    Args:
+        executor (ThreadPoolExecutor): 后台线程
+        context (Class2ICS.TaskContext): 任务上下文
+        task (callable): 任务函数
+        cancel_after (int): 收到该数量的进度后请求取消
+    Returns:
+        tuple: (任务结果或异常, 进度列表)
+    """
+    future = executor.submit(task, context, *args)
+    progress = []
+    while True:
+        done = future.done()
+        progress.extend(context.drain())
+        if cancel_after is not None and len(progress) >= cancel_after:
+            context.cancel()
+        if done:
+            break
+        time.sleep(0.005)
+    error = future.exception()
+    return (error if error is not None else future.result()), progress
+
+
+# 校验图形界面使用的后台任务
+def verify_worker(file_path: str, course_start_date: datetime.datetime) -> dict:
+    """
+    通过与图形界面相同的任务接口读取和导出课程表
+    校验输出与build_calendar一致 进度单调递增 取消后不留下文件
+    Args:
+        file_path (str): 课程表文件路径 为None时使用合成课程表
+        course_start_date (datetime.datetime): 学期开始日期
+    Returns:
+        dict: 各任务的耗时
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=1) as executor, \
+            tempfile.TemporaryDirectory() as temp_dir, \
+            tempfile.TemporaryDirectory() as input_dir:
+        if file_path is None:
+            file_path = os.path.join(input_dir, 'synthetic.xls')
+            with open(file_path, 'wb') as f:
+                f.write(synthetic_export())
+        start = time.perf_counter()
+        loaded, progress = poll_task(executor, Class2ICS.TaskContext(),
+                                     Class2ICS.load_course_file_task,
+                                     file_path)
+        results['load'] = time.perf_counter() - start
+        if isinstance(loaded, Exception):
+            raise loaded
+        calendar_name, course_list = loaded
+        export = Class2ICS.read_course_export(file_path)
+        if (calendar_name, course_list) != (
+                export.calendar_name, Class2ICS.table_to_list(export.table)):
+            raise AssertionError("后台读取的课程与直接读取的不一致")
+        fractions = [fraction for fraction, _ in progress]
+        if fractions != sorted(fractions) or fractions[-1] != 1.0:
+            raise AssertionError(f"读取进度异常: {fractions}")
+        course_list = course_list + EDGE_CASE_COURSES
+
+        save_path = os.path.join(temp_dir, 'worker.ics')
+        start = time.perf_counter()
+        ical, progress = poll_task(executor, Class2ICS.TaskContext(),
+                                   Class2ICS.export_calendar_task,
+                                   calendar_name, course_list,
+                                   course_start_date, 20, save_path)
+        results['export'] = time.perf_counter() - start
+        if isinstance(ical, Exception):
+            raise ical
+        expected = Class2ICS.build_calendar(calendar_name, course_list,
+                                            course_start_date).to_ical()
+        with open(save_path, 'rb') as f:
+            if not ical == f.read() == expected:
+                raise AssertionError("后台导出的日历与build_calendar不一致")
+        fractions = [fraction for fraction, _ in progress]
+        if fractions != sorted(fractions) or fractions[-1] != 1.0:
+            raise AssertionError(f"导出进度异常: {fractions}")
+
+        # 在大量课程的导出过程中取消
+        cancel_path = os.path.join(temp_dir, 'cancel.ics')
+        error, progress = poll_task(executor, Class2ICS.TaskContext(),
+                                    Class2ICS.export_calendar_task,
+                                    calendar_name, synthetic_courses(20000),
+                                    course_start_date, 20, cancel_path,
+                                    cancel_after=2)
+        if not isinstance(error, Class2ICS.TaskCancelled):
+            raise AssertionError("取消导出后任务没有停止")
+        if os.listdir(temp_dir) != ['worker.ics']:
+            raise AssertionError("取消导出后留下了文件")
+    print(f"读取 {results['load'] * 1000:.2f} ms, "
+          f"导出 {results['export'] * 1000:.2f} ms, 后台任务校验通过")
+    return results
+
+
+# 对转换服务进行压力测试
+def load_test(url: str, file_path: str, start: str, requests: int = 200,
+              concurrency: int = 16, unique: bool = False) -> dict:
+    """
+    并发向 Class2ICS_Server.py 发送转换请求 统计吞吐量和延迟
+    Args:
+        url (str): 服务地址 如 http://127.0.0.1:8000
+        file_path (str): 课程表文件路径
+        start (str): 学期开始日期
+        requests (int): 请求总数
+        concurrency (int): 并发数
+        unique (bool): 每个请求的内容不同 用于绕过服务端缓存
+    Returns:
+        dict: 状态码计数 吞吐量和延迟分位数
+    """
+    with open(file_path, 'rb') as f:
+        html = f.read()
+
+    def send(i: int) -> tuple:
+        body = html + f'<!-- {i} -->'.encode() if unique else html
+        request = urllib.request.Request(
+            f"{url.rstrip('/')}/convert?start={start}", data=body,
+            method='POST')
+        begin = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return status, time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - begin
+    latencies = sorted(latency for _, latency in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    summary = {
+        'statuses': statuses,
+        'throughput': requests / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+    print(f"状态码 {statuses}, 吞吐量 {summary['throughput']:.1f} 次/秒, "
+          f"p50 {summary['p50_ms']:.1f} ms, p95 {summary['p95_ms']:.1f} ms, "
+          f"最大 {summary['max_ms']:.1f} ms")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Class2ICS 性能测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parser_cmd = subparsers.add_parser('parser', help="比较解析引擎")
+    parser_cmd.add_argument('file', help="课程表文件路径")
+    parser_cmd.add_argument('--repeat', type=int, default=10)
+    week_cmd = subparsers.add_parser('week', help="校验并比较周数解析")
+    week_cmd.add_argument('--repeat', type=int, default=10)
+    week_cmd.add_argument('--loops', type=int, default=10000)
+    cell_cmd = subparsers.add_parser('cell', help="校验并比较课程字符串解析")
+    cell_cmd.add_argument('--repeat', type=int, default=10)
+    cell_cmd.add_argument('--loops', type=int, default=200)
+    occurrence_cmd = subparsers.add_parser('occurrence',
+                                           help="校验并比较上课时间计算")
+    occurrence_cmd.add_argument('--count', type=int, default=20000)
+    occurrence_cmd.add_argument('--repeat', type=int, default=3)
+    rrule_cmd = subparsers.add_parser('verify-rrule', help="校验重复规则输出")
+    rrule_cmd.add_argument('file', help="课程表文件路径")
+    rrule_cmd.add_argument('--start', required=True,
+                           help="学期开始日期(格式:2024-02-24)")
+    writer_cmd = subparsers.add_parser('verify-writer', help="校验流式写入")
+    writer_cmd.add_argument('file', nargs='?', default=None,
+                            help="课程表文件路径 默认使用合成课程表")
+    writer_cmd.add_argument('--start', default='2024-02-26',
+                            help="学期开始日期(格式:2024-02-24)")
+    writer_cmd.add_argument('--repeat', type=int, default=3)
+    shard_cmd = subparsers.add_parser('verify-shard', help="校验分片并行生成日历")
+    shard_cmd.add_argument('file', help="课程表文件路径")
+    shard_cmd.add_argument('--start', required=True,
+                           help="学期开始日期(格式:2024-02-24)")
+    shard_cmd.add_argument('--count', type=int, default=20000)
+    shard_cmd.add_argument('--shard-size', type=int, default=500)
+    shard_cmd.add_argument('--workers', type=int, default=None)
+    worker_cmd = subparsers.add_parser('verify-worker',
+                                       help="校验图形界面的后台任务")
+    worker_cmd.add_argument('file', nargs='?', default=None,
+                            help="课程表文件路径 默认使用合成课程表")
+    worker_cmd.add_argument('--start', default='2024-02-26',
+                            help="学期开始日期(格式:2024-02-24)")
+    synthetic_cmd = subparsers.add_parser('synthetic', help="生成合成课程表")
+    suite_cmd = subparsers.add_parser('suite', help="用合成课程表测试每个阶段")
+    for cmd in (synthetic_cmd, suite_cmd):
+        cmd.add_argument('--files', type=int, default=5, help="文件数量")
+        cmd.add_argument('--rows', type=int, default=11, help="节次行数")
+        cmd.add_argument('--fill', type=float, default=0.5,
+                         help="单元格中有课程的比例")
+        cmd.add_argument('--courses-per-cell', type=int, default=1)
+        cmd.add_argument('--week-complexity', type=int, default=1,
+                         help="周数表达式的项数")
+        cmd.add_argument('--seed', type=int, default=0)
+    synthetic_cmd.add_argument('directory', help="输出目录")
+    suite_cmd.add_argument('--repeat', type=int, default=5)
+    suite_cmd.add_argument('--start', default='2024-02-26',
+                           help="学期开始日期(格式:2024-02-24)")
+    suite_cmd.add_argument('--engine', choices=Class2ICS.PARSER_ENGINES,
+                           default='full')
+    suite_cmd.add_argument('--rrule', action='store_true')
+    suite_cmd.add_argument('--stream', action='store_true')
+    suite_cmd.add_argument('--output', default=None,
+                           help="结果JSON文件路径 默认为 benchmarks/时间.json")
+    suite_cmd.add_argument('--compare', default=None,
+                           help="与之前的结果JSON文件比较")
+    load_cmd = subparsers.add_parser('load', help="对转换服务进行压力测试")
+    load_cmd.add_argument('file', help="课程表文件路径")
+    load_cmd.add_argument('--start', required=True,
+                          help="学期开始日期(格式:2024-02-24)")
+    load_cmd.add_argument('--url', default='http://127.0.0.1:8000')
+    load_cmd.add_argument('--requests', type=int, default=200)
+    load_cmd.add_argument('--concurrency', type=int, default=16)
+    load_cmd.add_argument('--unique', action='store_true',
+                          help="每个请求的内容不同 绕过服务端缓存")
+    args = parser.parse_args()
+    if args.command == 'parser':
+        bench_parser(args.file, args.repeat)
+    elif args.command == 'week':
+        bench_week(args.repeat, args.loops)
+    elif args.command == 'cell':
+        bench_cell(args.repeat, args.loops)
+    elif args.command == 'occurrence':
+        bench_occurrence(args.count, args.repeat)
+    elif args.command == 'verify-writer':
+        verify_writer(args.file,
+                      datetime.datetime.strptime(args.start, "%Y-%m-%d"),
+                      args.repeat)
+    elif args.command == 'verify-shard':
+        verify_shard(args.file,
+                     datetime.datetime.strptime(args.start, "%Y-%m-%d"),
+                     args.count, args.shard_size, args.workers)
+    elif args.command == 'verify-worker':
+        verify_worker(args.file,
+                      datetime.datetime.strptime(args.start, "%Y-%m-%d"))
+    elif args.command == 'synthetic':
+        paths = write_synthetic_exports(
+            args.directory, args.files, args.seed, rows=args.rows,
+            fill=args.fill, courses_per_cell=args.courses_per_cell,
+            week_complexity=args.week_complexity)
+        print(f"已生成 {len(paths)} 个文件")
+    elif args.command == 'suite':
+        output = args.output
+        if output is None:
+            output = (Path(__file__).resolve().parent / 'benchmarks' /
+                      f"{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+        bench_suite(args.files, args.rows, args.fill, args.courses_per_cell,
+                    args.week_complexity, args.repeat, args.seed, args.start,
+                    Class2ICS.ConvertOptions(engine=args.engine,
+                                             rrule=args.rrule,
+                                             stream=args.stream),
+                    output, args.compare)
+    elif args.command == 'load':
+        load_test(args.url, args.file, args.start, args.requests,
+                  args.concurrency, args.unique)
+    elif args.command == 'verify-rrule':
+        verify_rrule(args.file,
+                     datetime.datetime.strptime(args.start, "%Y-%m-%d"))
@@ -1,5 +1,6 @@
-import copy
 import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from pathlib import Path
@@ -14,14 +15,24 @@ FONT = "Songti SC"
 WINDOW_WIDTH = 1000
 WINDOW_HEIGHT = 350
 
+# 轮询后台任务进度的间隔(毫秒)
+POLL_INTERVAL = 50
+# 读取和导出文件的后台线程 界面线程只负责显示
+executor = ThreadPoolExecutor(max_workers=1)
+
 # 课程名称
 course_schedule_name = ""
 # 最大周数
 max_week = 0
 # 课程列表
 course_list = []
-# 展示表格
-show_table = []
+# 周数->节次->星期->课程文本 的索引
+course_index = {}
+
+# 展示表格的表头和第一列
+SHOW_TABLE_HEADER = ('节次/周次', '星期一', '星期二', '星期三', '星期四', '星期五', '星期六',
+                     '星期日')
+SHOW_TABLE_PERIODS = {1: '1-2节', 3: '3-4节', 5: '5-6节', 7: '7-8节', 9: '9-10节'}
 
 
 # 创建初始界面
@@ -62,32 +73,45 @@ def read_file():
         start_page()
         return
 
-    global max_week, show_table, course_schedule_name, course_list
-    # 读取文件内容
-    soup = Class2ICS.read_html_file(file_path)
-    if soup is None:
-        messagebox.showerror("错误", "文件中不存在课程表")
-        start_page()
-        return
-    table = Class2ICS.parse_soup_to_table(soup)
-    course_list = Class2ICS.table_to_list(table)
+    label.config(text="正在读取文件")
+    # 在后台线程中读取文件
+    run_in_background(root, Class2ICS.load_course_file_task, (file_path, ),
+                      on_file_loaded, on_load_failed)
+
+
+# 文件读取完成
+def on_file_loaded(result: tuple):
+    """
+    文件读取完成后在界面线程中调用
+    Args:
+        result (tuple): (课程表名称, 课程记录列表)
+    """
+    global max_week, course_index, course_schedule_name, course_list
+    # 获取课程表名称
+    course_schedule_name, course_list = result
     # 获取最大周数
     max_week = get_max_week(course_list)
-    # 将课程列表转换为展示表格
-    show_table = cource_list_to_show_table(course_list, max_week)
-    # 获取课程表名称
-    course_schedule_name = Class2ICS.get_course_name(soup)
+    # 建立课程索引 每周的展示表格在切换周数时再生成
+    course_index = build_course_index(course_list)
+    week_table.cache_clear()
 
     # 创建表格界面
     create_table()
 
 
+# 文件读取失败或取消
+def on_load_failed(error: Exception):
+    if not isinstance(error, Class2ICS.TaskCancelled):
+        messagebox.showerror("错误", str(error))
+    start_page()
+
+
 # 保存文件页面
 def save_file_page():
     # 创建一个新窗口
     save_window = tk.Toplevel(root)
     save_window.title("保存文件")
-    save_window.geometry("300x200")
+    save_window.geometry("300x280")
     try:
         save_window.iconbitmap(icon_path)
     except:
@@ -96,8 +120,8 @@ def save_file_page():
     screen_width = save_window.winfo_screenwidth()
     screen_height = save_window.winfo_screenheight()
     x = (screen_width - 300) // 2
-    y = (screen_height - 200) // 2
-    save_window.geometry(f"300x200+{x}+{y}")
+    y = (screen_height - 280) // 2
+    save_window.geometry(f"300x280+{x}+{y}")
 
     label = ttk.Label(save_window, text="请设置课程开始日期", font=("Songti SC", 14))
     label.pack(pady=10)
@@ -112,17 +136,21 @@ def save_file_page():
     button = ttk.Button(
         save_window,
         text="保存",
-        command=lambda: save_ics(course_list, entry_date.get()))
+        command=lambda: save_ics(course_list, entry_date.get(), save_window,
+                                 button))
     button.pack(pady=10)
 
 
 # 保存日历
-def save_ics(course_list: list, course_start_date: str):
+def save_ics(course_list: list, course_start_date: str, save_window,
+             button):
     """
-    保存日历文件
+    保存日历文件 日历在后台线程中生成和写入
     Args:
         course_list (list): 课程列表
         course_start_date (str): 课程开始日期
+        save_window (tk.Toplevel): 保存文件窗口
+        button (ttk.Button): 保存按钮 导出期间禁用
     """
     # 转为datatime格式
     try:
@@ -131,21 +159,6 @@ def save_ics(course_list: list, course_start_date: str):
     except ValueError:
         messagebox.showerror("错误", "日期格式错误")
         return
-    # 初始化日历
-    cal = Class2ICS.init_calendar(course_schedule_name)
-    # 将课程列表写入日历
-    for course_dict in course_list:
-        # 计算课程开始时间
-        date_time_list = Class2ICS.calculate_course_start_time(
-            course_start_date, course_dict)
-        # 添加课程事件
-        Class2ICS.add_course_event(cal, course_dict, date_time_list)
-
-    for i in range(1, max_week + 3):
-        Class2ICS.add_week_event(cal, i, course_start_date)
-
-    # 写入日历文件
-    str = cal.to_ical()
     # 保存到选择的路径下
     # 名称为课程表名称.ics
     save_path = filedialog.asksaveasfilename(
@@ -153,13 +166,70 @@ def save_ics(course_list: list, course_start_date: str):
         initialfile=course_schedule_name + "课程表.ics",
         filetypes=[("ICS files", "*.ics")],
         title="保存文件")
-    try:
-        with open(save_path, "wb") as f:
-            f.write(str)
-    except:
-        messagebox.showerror("错误", "保存失败")
+    if not save_path:
         return
-    messagebox.showinfo("保存成功", f"日历文件已保存到:\n{save_path}")
+
+    def on_saved(result):
+        button.config(state=tk.NORMAL)
+        messagebox.showinfo("保存成功", f"日历文件已保存到:\n{save_path}")
+
+    def on_failed(error):
+        button.config(state=tk.NORMAL)
+        if not isinstance(error, Class2ICS.TaskCancelled):
+            messagebox.showerror("错误", "保存失败")
+
+    button.config(state=tk.DISABLED)
+    # 生成日历 周事件比最大周数多两周
+    run_in_background(save_window, Class2ICS.export_calendar_task,
+                      (course_schedule_name, course_list, course_start_date,
+                       max_week + 2, save_path), on_saved, on_failed)
+
+
+# 在后台线程中运行任务
+def run_in_background(parent, task, args: tuple, on_done, on_error):
+    """
+    在后台线程中运行任务 通过root.after轮询进度并更新进度条
+    任务结束后在界面线程中调用on_done(结果) 失败或取消时调用on_error(异常)
+    Args:
+        parent: 放置进度条和取消按钮的窗口
+        task (callable): 任务函数 第一个参数为TaskContext
+        args (tuple): 任务的其余参数
+        on_done (callable): 成功时的回调
+        on_error (callable): 失败或取消时的回调
+    Returns:
+        TaskContext: 任务上下文
+    """
+    context = Class2ICS.TaskContext()
+    frame = ttk.Frame(parent)
+    frame.pack(pady=5)
+    progress_label = ttk.Label(frame, text="", font=("Songti SC", 12))
+    progress_label.pack()
+    progress_bar = ttk.Progressbar(frame, length=250, maximum=1.0)
+    progress_bar.pack(pady=5)
+    cancel_button = ttk.Button(frame, text="取消", command=context.cancel)
+    cancel_button.pack()
+    future = executor.submit(task, context, *args)
+
+    def poll():
+        # 窗口已关闭 取消任务且不再回调
+        if not frame.winfo_exists():
+            context.cancel()
+            return
+        for fraction, message in context.drain():
+            progress_bar.config(value=fraction)
+            progress_label.config(text=message)
+        if not future.done():
+            root.after(POLL_INTERVAL, poll)
+            return
+        frame.destroy()
+        error = future.exception()
+        if error is not None:
+            on_error(error)
+        else:
+            on_done(future.result())
+
+    root.after(POLL_INTERVAL, poll)
+    return context
 
 
 # 关于页面
@@ -239,10 +309,10 @@ def create_table():
     # 初始化表格
     global table
     table = ttk.Treeview(table_frame,
-                         columns=show_table[0][0],
+                         columns=SHOW_TABLE_HEADER,
                          show="headings")
     # 设置表头
-    for col in show_table[0][0]:
+    for col in SHOW_TABLE_HEADER:
         table.heading(col, text=col)
         table.column(col, width=100)
     table.pack(fill=tk.BOTH, pady=5)
@@ -255,12 +325,12 @@ def refresh_tables(selected_value):
     """
     刷新所有表格的内容
     """
-    data = show_table[int(selected_value) - 1]
+    data = week_table(int(selected_value))
     # 删除旧数据
     for row in table.get_children():
         table.delete(row)
     # 插入新数据
-    for row_data in data[1:]:
+    for row_data in data:
         table.insert("", "end", values=row_data)
 
 
@@ -280,73 +350,56 @@ def get_max_week(course_list: list) -> int:
     """
     从课程列表中获取最大周数
     Args:
-        course_list (list): 课程列表
+        course_list (list): 课程记录列表
     Returns:
         int: 最大周数
     """
     max_week = 0
     for course in course_list:
-        for week in course['week']:
-            if week > max_week:
-                max_week = week
+        # 周数为升序元组 最后一个即最大周数
+        if course.week and course.week[-1] > max_week:
+            max_week = course.week[-1]
     return max_week
 
 
-# 将课程列表转换为展示表格
-def cource_list_to_show_table(course_list: list, max_week: int) -> list:
+# 建立课程索引
+def build_course_index(course_list: list) -> dict:
     """
+    遍历一次课程列表 建立 周数->节次->星期->课程文本 的索引
+    同一单元格有多门课程时保留列表中靠后的课程
     Args:
-        course_list (list): 课程列表
-        max_week (int): 最大周数
+        course_list (list): 课程记录列表
     Returns:
-        list: 课程表
+        dict: 课程索引
     """
-    course_list = copy.deepcopy(course_list)
-
-    first_column = {1: '1-2节', 3: '3-4节', 5: '5-6节', 7: '7-8节', 9: '9-10节'}
-    period_dict = {
-        '第一节': 1,
-        '第二节': 2,
-        '第三节': 3,
-        '第四节': 4,
-        '第五节': 5,
-        '第六节': 6,
-        '第七节': 7,
-        '第八节': 8,
-        '第九节': 9,
-        '第十节': 10,
-        '第十一节': 11
-    }
-    weekday_dict = {
-        '星期一': 1,
-        '星期二': 2,
-        '星期三': 3,
-        '星期四': 4,
-        '星期五': 5,
-        '星期六': 6,
-        '星期日': 7
-    }
-
+    index = {}
     for course in course_list:
-        course['weekday'] = weekday_dict[course['weekday']]
-        course['period'] = period_dict[course['period']]
-
-    all_table = []
-    week = 1
-    while (week <= max_week):
-        weekly_table = [[
-            '节次/周次', '星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日'
-        ]]
-        for i in range(1, 10, 2):
-            row = [first_column[i], '', '', '', '', '', '', '']
-            for course in course_list:
-                if week in course['week'] and course['period'] == i:
-                    row[course['weekday']] = course['name'] + '\n' + course[
-                        'teacher'] + '\n' + course['location']
-            weekly_table.append(row)
-        all_table.append(weekly_table)
-        week += 1
-    return all_table
+        if course.period not in SHOW_TABLE_PERIODS:
+            continue
+        text = course.name + '\n' + course.teacher + '\n' + course.location
+        for week in course.week:
+            index.setdefault(week, {}).setdefault(course.period,
+                                                  {})[course.weekday] = text
+    return index
+
+
+# 生成某一周的展示表格
+@lru_cache(maxsize=32)
+def week_table(week: int) -> tuple:
+    """
+    根据课程索引生成某一周的展示表格 结果按周数缓存 读取新文件时清空
+    Args:
+        week (int): 周数
+    Returns:
+        tuple: 不含表头的表格行
+    """
+    periods = course_index.get(week, {})
+    rows = []
+    for period, label in SHOW_TABLE_PERIODS.items():
+        weekdays = periods.get(period, {})
+        rows.append((label, ) +
+                    tuple(weekdays.get(day, '') for day in range(1, 8)))
+    return tuple(rows)
 
 
 # 初始化窗口
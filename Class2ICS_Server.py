@@ -0,0 +1,258 @@
+import os
+import json
+import logging
+import argparse
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs, quote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import Class2ICS
+
+# 上传文件大小上限
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# 单次转换的超时时间(秒)
+CONVERT_TIMEOUT = 60
+
+
+# ICS内容缓存
+class ResponseCache:
+    """
+    以课程表内容哈希和转换选项为键的LRU缓存
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# 同时进行的转换数已达上限
+class ServerBusy(Exception):
+    pass
+
+
+# 转换服务
+class ConversionServer(ThreadingHTTPServer):
+    """
+    常驻的课程表转换服务
+    解析和生成日历在进程池中进行 同时进行的转换数超过上限时返回503
+    命中缓存或等待相同内容的转换不占用转换名额
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, max_concurrent=16,
+                 cache_size=256, profiles=None):
+        super().__init__(address, ConversionHandler)
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.cache = ResponseCache(cache_size)
+        self.profiles = profiles or {}
+        self.rejected = 0
+        # 正在转换的请求 相同内容的并发请求共用一次转换
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        # 预先启动工作进程 避免首个请求等待进程启动和模块导入
+        for _ in range(workers or os.cpu_count() or 1):
+            self.executor.submit(int)
+
+    def convert(self, key, html, course_start_date, options) -> tuple:
+        """
+        转换课程表 优先使用缓存和正在进行的相同转换
+        只有新的转换占用名额 名额在转换完成时释放
+        Returns:
+            tuple: (日历名称, ICS内容)
+        Raises:
+            ServerBusy: 需要新的转换但同时进行的转换数已达上限
+        """
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        with self.pending_lock:
+            future = self.pending.get(key)
+            submitted = future is None
+            if submitted:
+                if not self.slots.acquire(blocking=False):
+                    raise ServerBusy()
+                try:
+                    future = self.executor.submit(Class2ICS.convert_bytes,
+                                                  html, course_start_date,
+                                                  options)
+                except Exception:
+                    self.slots.release()
+                    raise
+                self.pending[key] = future
+        # 已完成的future会在当前线程立即调用回调 必须在释放锁之后注册
+        if submitted:
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return future.result(timeout=CONVERT_TIMEOUT)
+
+    def _finish(self, key, future):
+        with self.pending_lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+        self.slots.release()
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+# 请求处理
+class ConversionHandler(BaseHTTPRequestHandler):
+    """
+    POST /convert?start=2024-02-26[&rrule=1][&engine=fast][&campus=名称]
+        请求体为课程表文件内容 返回ICS文件
+    GET /health
+        返回缓存命中和拒绝请求的统计
+    """
+    server: ConversionServer
+
+    def log_message(self, format, *args):
+        logging.info("%s - %s", self.address_string(), format % args)
+
+    def send_text(self, status: int, text: str, headers=None):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/health':
+            self.send_text(404, "not found")
+            return
+        cache = self.server.cache
+        body = json.dumps({
+            'cache_entries': len(cache.entries),
+            'cache_hits': cache.hits,
+            'cache_misses': cache.misses,
+            'rejected': self.server.rejected,
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/convert':
+            self.send_text(404, "not found")
+            return
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            course_start_date = datetime.datetime.strptime(
+                query.get('start', ''), "%Y-%m-%d")
+        except ValueError:
+            self.send_text(400, "start 参数格式错误(格式:2024-02-24)")
+            return
+        campus = query.get('campus')
+        if campus is not None and campus not in self.server.profiles:
+            self.send_text(400, f"未知的校区: {campus}")
+            return
+        options = Class2ICS.ConvertOptions(
+            engine=query.get('engine', 'full'),
+            rrule=query.get('rrule') == '1',
+            stream=True,
+            schedule=self.server.profiles.get(campus))
+        if options.engine not in Class2ICS.PARSER_ENGINES:
+            self.send_text(400, f"未知的解析引擎: {options.engine}")
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_text(400, "Content-Length 格式错误")
+            return
+        if length <= 0:
+            self.send_text(400, "请求体为空")
+            return
+        if length > MAX_UPLOAD_SIZE:
+            self.send_text(413, "文件过大")
+            return
+        html = self.rfile.read(length)
+        # 解析引擎不影响输出 不作为缓存键
+        key = (hashlib.sha256(html).hexdigest(), query['start'],
+               options.rrule, campus)
+        try:
+            result = self.server.convert(key, html, course_start_date,
+                                         options)
+        except ServerBusy:
+            # 超过并发上限时直接拒绝 由客户端稍后重试
+            self.server.rejected += 1
+            self.send_text(503, "服务繁忙", {'Retry-After': '1'})
+            return
+        except ValueError as e:
+            self.send_text(400, str(e))
+            return
+        except TimeoutError:
+            self.send_text(504, "转换超时")
+            return
+        except Exception as e:
+            logging.error(f"转换失败: {type(e).__name__}: {e}")
+            self.send_text(500, "转换失败")
+            return
+        calendar_name, ical = result
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(ical)))
+        self.send_header(
+            'Content-Disposition',
+            f"attachment; filename*=UTF-8''{quote(calendar_name)}.ics")
+        self.end_headers()
+        self.wfile.write(ical)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="课程表转ICS服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="进程池大小 默认为CPU核数")
+    parser.add_argument('--max-concurrent', type=int, default=16,
+                        help="同时进行的转换数上限 命中缓存的请求不受限制")
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help="缓存的ICS文件数量")
+    parser.add_argument('--schedule', metavar='PATH', default=None,
+                        help="作息时间配置文件(JSON) 请求中用campus参数选择")
+    args = parser.parse_args()
+    profiles = {}
+    if args.schedule is not None:
+        profiles = Class2ICS.load_schedule_profiles(args.schedule)
+    server = ConversionServer((args.host, args.port), args.workers,
+                              args.max_concurrent, args.cache_size, profiles)
+    logging.info(f"服务已启动 http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()